@@ -1,19 +1,92 @@
-from memory import GraphAddressSpace, MemoryCell
+from memory import GraphAddressSpace, ArrayAddressSpace
+from bitwindow import BitWindow, as_bit_buffer, pack_msb
+from streams import GammaGraph
+from stride import StrideTable, bit_of, unpack_msb
+from steady import SteadyAutomaton
+from parallel_build import construct_parallel, can_build_parallel
+from instrumentation import Instrumentation, Tracer, BUILD_START, LEVEL_READY
+from contextlib import nullcontext
 from typing import List, Optional, Dict, Tuple, Any
 
+
+class _Handoff:
+    """
+    Курсор, который ищет в новом дереве узел текущего окна, пока старый
+    курсор продолжает отвечать. start — номер первого бита отслеживаемого
+    окна в потоке, depth — сколько его бит уже пройдено от корня.
+    cost и bits — операции поиска и число бит, за которые он идёт.
+    """
+    __slots__ = ('N', 'node', 'depth', 'start', 'cost', 'bits')
+
+    def __init__(self, root: int, N: int, start: int):
+        self.N = N
+        self.node = root
+        self.depth = 0
+        self.start = start
+        self.cost = 0
+        self.bits = 0
+
+    def ready(self, stream_length: int) -> bool:
+        return self.depth == self.N and self.start + self.N == stream_length
+
+
 class KolmogorovUspenskyMachine:
     """
     Реализация KUM с построением равномерных деревьев и суффиксных ссылок.
+
+    Машина работает только через API адресного пространства
+    (allocate / add_pointer / follow), поэтому узлы везде задаются адресами,
+    а память может быть как объектной (GraphAddressSpace), так и
+    столбцовой (ArrayAddressSpace).
     """
-    def __init__(self):
-        self.memory = GraphAddressSpace()
+    EXPANSION_MODES = ('rebuild', 'in_place')
+    # Сколько операций за один входной бит можно потратить на поиск окна в новом дереве
+    HANDOFF_BUDGET = 4
+    # Бор глубже 64 — это 2^65 узлов: окна больше машине не построить
+    MAX_WINDOW = 64
+    _EDGE = ('0', '1')
+
+    def __init__(self, memory: Optional[GraphAddressSpace] = None, debug_payload: bool = False,
+                 expansion: str = 'rebuild', seamless: bool = False, history: bool = False,
+                 max_window: Optional[int] = None):
+        if expansion not in self.EXPANSION_MODES:
+            raise ValueError(f"Unknown expansion mode: {expansion}")
+        self.memory = memory if memory is not None else GraphAddressSpace()
+        # Хранить в узлах отладочное содержимое ('path_key', 'type').
+        # Для работы машины оно не нужно: хватает метки и ссылок.
+        self.debug_payload = debug_payload
+        # 'rebuild'  — каждое Γ(L) строится отдельным деревом, Γ(0)..Γ(L) живут вместе;
+        # 'in_place' — верхнее дерево достраивается вниз, в памяти одно дерево.
+        self.expansion = expansion
+        # seamless: курсор переносится через смену уровня без прохода O(N),
+        # и начальное окно тоже ищется по одному шагу на бит
+        self.seamless = seamless
         self.current_L = 0
+        self.window_size = 1
         self.operations = 0
-        self.trees: Dict[int, MemoryCell] = {}
-        self.input_buffer: List[int] = []
-
-
-        self.current_path_node: Optional[MemoryCell] = None 
+        self.trees: Dict[int, int] = {}
+        self.levels: Dict[int, List[range]] = {}
+        # Деревья точных окон (build_window) по размеру окна N, не обязательно 2^L
+        self.windows: Dict[int, int] = {}
+        self.window_levels: Dict[int, List[range]] = {}
+        # Размер окна целевого дерева, если это точное окно, а не Γ(current_L)
+        self.exact_window: Optional[int] = None
+        # Кольцевое окно входа: хранит max_window последних бит — столько, сколько
+        # нужно самому большому окну, которое машину могут попросить построить.
+        # Растить кольцо при активации уровня поздно: к двум расширениям подряд
+        # нужные биты уже вытеснены. history=True — хранить весь вход, как раньше.
+        self.max_window = max_window if max_window is not None else self.MAX_WINDOW
+        self.input_buffer = BitWindow(self.max_window, keep_history=history)
+
+
+        self.current_path_node: Optional[int] = None 
+        self._walker: Optional[_Handoff] = None
+        # Необязательная таблица переходов на k бит для process_packed
+        self.stride_table: Optional[StrideTable] = None
+        # После compact_steady_state: курсор — номер листа в автомате, графа нет
+        self.automaton: Optional[SteadyAutomaton] = None
+        # Таймеры фаз, гистограмма стоимости и трассировка (enable_instrumentation)
+        self.instrumentation: Optional[Instrumentation] = None
 
 
         self.demo_mode = False
@@ -24,128 +97,476 @@ class KolmogorovUspenskyMachine:
             'traversals': 0
         }
 
-    def _collect_leaves(self, node: MemoryCell) -> List[MemoryCell]:
-        """BFS сбор листьев для расширения дерева"""
-        leaves = []
-        q = [node]
-        visited = set()
-        while q:
-            current = q.pop(0)
-            if current.address in visited: continue
-            visited.add(current.address)
-
+    def _path_key(self, node: int) -> str:
+        content = self.memory.get_content(node)
+        return content.get('path_key', '') if isinstance(content, dict) else ''
 
-            if '0' not in current.pointers and '1' not in current.pointers:
-                leaves.append(current)
+    def _extend_levels(self, levels: List[range], depth: int):
+        """
+        Достроить полный бор уровнями до глубины depth вместе со ссылками 'S'.
+        Уровень d+1 выделяется одним блоком: дети i-го узла уровня d
+        лежат на местах 2i и 2i+1, метка ребёнка — метка родителя XOR бит ребра.
+        Ссылки 'S' строятся как функции неудач Ахо–Корасик:
+        S(child(p, b)) = child(S(p), b), а узлы глубины 1 ссылаются на корень.
+        Итого O(1) на узел, без словарей путей.
+        """
+        mem = self.memory
+        root = levels[0][0]
+        while len(levels) <= depth:
+            parents = levels[-1]
+            with self._phase('allocate'):
+                labels = [mem.get_label(p) ^ b for p in parents for b in (0, 1)]
+                payloads = None
+                if self.debug_payload:
+                    node_type = 'leaf' if len(levels) == depth else 'node'
+                    payloads = [{'type': node_type, 'path_key': key + b}
+                                for key in map(self._path_key, parents)
+                                for b in '01']
+                block = mem.allocate_block(labels, payloads)
+
+            with self._phase('child-links'):
+                mem.add_pointers(parents, '0', range(block.start, block.stop, 2))
+                mem.add_pointers(parents, '1', range(block.start + 1, block.stop, 2))
+
+            with self._phase('suffix-links'):
+                if len(levels) == 1:
+                    suffixes = [root] * len(block)
+                else:
+                    suffixes = [mem.follow(mem.follow(p, 'S'), label)
+                                for p in parents for label in ('0', '1')]
+                mem.add_pointers(block, 'S', suffixes)
+            self.stats['edges_created'] += len(block)
+            levels.append(block)
+
+    def _count_construction(self, L: int):
+        """
+        Учёт stats по схеме «копия Γ(L-1) + копия Γ(L-1) под каждым листом»,
+        чтобы счётчики совпадали с прежним рекурсивным построением.
+        """
+        if L == 0:
+            nodes, edges = 3, 2
+        else:
+            prev_nodes = 2 ** (2 ** (L - 1) + 1) - 1
+            copies = 1 + 2 ** 2 ** (L - 1)
+            nodes, edges = prev_nodes * copies, (prev_nodes - 1) * copies
+        self.stats['nodes_created'] += nodes
+        self.stats['edges_created'] += edges
+
+    @staticmethod
+    def tree_size(L: int) -> int:
+        """Число узлов Γ(L): полный бинарный бор глубины 2^L"""
+        return 2 ** (2**L + 1) - 1
+
+    @property
+    def target_N(self) -> int:
+        """Глубина целевого дерева — размер окна, на который переходит машина"""
+        return self.exact_window if self.exact_window is not None else 2**self.current_L
+
+    @property
+    def target_root(self) -> int:
+        if self.exact_window is not None:
+            return self.windows[self.exact_window]
+        return self.trees[self.current_L]
+
+    @property
+    def target_levels(self) -> List[range]:
+        if self.exact_window is not None:
+            return self.window_levels[self.exact_window]
+        return self.levels[self.current_L]
+
+    def _deepest_tree(self) -> Optional[Tuple[int, List[range]]]:
+        """(корень, уровни) самого глубокого дерева в памяти — Γ(L) или точного окна"""
+        candidates = [(self.trees[L], self.levels[L]) for L in self.trees]
+        candidates += [(self.windows[N], self.window_levels[N]) for N in self.windows]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda tree: len(tree[1]))
+
+    def _can_extend_to(self, depth: int) -> bool:
+        deepest = self._deepest_tree()
+        return self.expansion == 'in_place' and deepest is not None and len(deepest[1]) - 1 < depth
+
+    def _extend_in_place(self, depth: int, root_content: Dict[str, Any]) -> Tuple[int, List[range]]:
+        """
+        Рост самого глубокого дерева до глубины depth на месте: к его листьям
+        дописываются недостающие уровни. Создаются только новые узлы, их метки
+        и ссылки 'S'. Узлы старой глубины и их ссылки не меняются, поэтому
+        курсор старого уровня может работать, пока идёт достройка.
+        """
+        root, levels = self._deepest_tree()
+        levels = list(levels)
+        created = len(self.memory)
+
+        if self.debug_payload:
+            for leaf in levels[-1]:
+                content = self.memory.get_content(leaf)
+                content['type'] = 'node'
+                self.memory.set_content(leaf, content)
+        self._extend_levels(levels, depth)
+
+        content = self.memory.get_content(root)
+        content.pop('L', None)
+        content.pop('N', None)
+        content.update(root_content)
+        self.memory.set_content(root, content)
+
+        created = len(self.memory) - created
+        self.stats['nodes_created'] += created
+        self.stats['edges_created'] += created
+        return root, levels
+
+    def drop_levels_below(self, L: int):
+        """Забыть деревья Γ(l) при l < L (их узлы остаются в памяти до сборки мусора)"""
+        for level in [l for l in self.trees if l < L]:
+            del self.trees[level]
+            del self.levels[level]
+
+    def collect_garbage(self, compact: bool = True, drop_superseded: bool = False) -> Dict[str, Any]:
+        """
+        Освободить узлы, недостижимые из живых деревьев (trees, windows) и
+        курсоров (текущего и переносимого на новый уровень), и при compact
+        перенумеровать память подряд. drop_superseded — сначала забыть все
+        деревья, кроме целевого. Адреса деревьев, уровней, курсоров и
+        stride_table переводятся; GammaGraph и курсоры потоков, снятые
+        раньше, надо снять заново. Не вызывать, пока идёт фоновое построение:
+        его узлы ещё ни от чего не достижимы.
+        """
+        if drop_superseded:
+            keep_L = self.current_L if self.exact_window is None else None
+            for L in [l for l in self.trees if l != keep_L]:
+                del self.trees[L]
+                del self.levels[L]
+            for N in [n for n in self.windows if n != self.exact_window]:
+                del self.windows[N]
+                del self.window_levels[N]
+
+        mem = self.memory
+        roots = list(self.trees.values()) + list(self.windows.values())
+        if self.automaton is None:
+            roots.append(self.current_path_node)
+        if self._walker is not None:
+            roots.append(self._walker.node)
+        before = len(mem)
+        freed = mem.collect(roots)
+        if compact:
+            self._remap_addresses(mem.compact())
+        return {'before': before, 'freed': freed, 'live': len(mem), 'compacted': compact}
+
+    def _remap_addresses(self, remap: Dict[int, int]):
+        """Перевести все адреса машины после compact (уровни живых деревьев остаются сплошными)"""
+        def levels_of(levels: List[range]) -> List[range]:
+            return [range(remap[level.start], remap[level.start] + len(level)) for level in levels]
+
+        self.trees = {L: remap[root] for L, root in self.trees.items()}
+        self.levels = {L: levels_of(levels) for L, levels in self.levels.items()}
+        self.windows = {N: remap[root] for N, root in self.windows.items()}
+        self.window_levels = {N: levels_of(levels) for N, levels in self.window_levels.items()}
+        if self.automaton is None and self.current_path_node is not None:
+            self.current_path_node = remap[self.current_path_node]
+        if self._walker is not None:
+            self._walker.node = remap[self._walker.node]
+        table = self.stride_table
+        if table is not None and table.automaton is None and table.memory is self.memory:
+            if table.leaves.start in remap:
+                table.leaves = range(remap[table.leaves.start], remap[table.leaves.start] + len(table.leaves))
             else:
-                for label, child in current.pointers.items():
-                    if label in ['0', '1'] and child:
-                        q.append(child)
-        return leaves
-
-    def copy_subtree(self, node: MemoryCell, xor_mask: int = 0, prefix: str = '') -> MemoryCell:
-        """Копирование поддерева с применением XOR к метке"""
-        if node is None: return None
-
-
-        content = node.content.copy() if node.content else {}
-        if 'label' in content:
-            content['label'] ^= xor_mask
-        content['path_key'] = prefix 
-
-
-
-        new_node = self.memory.allocate(content=content)
-        self.stats['nodes_created'] += 1
-        
-        for label, child in node.pointers.items():
-            if label not in ['S']: 
-                if child:
-                    new_child = self.copy_subtree(child, xor_mask=xor_mask, prefix=prefix + label)
-                    self.memory.add_pointer(new_node.address, label, new_child.address)
-
-
-
-
-
-
-                    self.stats['edges_created'] += 1
-        return new_node
-
-
+                self.stride_table = None
+
+    def _phase(self, name: str):
+        """Замер фазы построения, если инструментирование включено"""
+        inst = self.instrumentation
+        return inst.phase(name, self.memory) if inst is not None else nullcontext()
+
+    def _traced_build(self, build, *args, **info) -> Tuple[int, List[range]]:
+        inst = self.instrumentation
+        if inst is None:
+            return build(*args)
+        inst.emit(BUILD_START, in_place=self._can_extend_to(info['N']), **info)
+        with inst.phase('construct', self.memory):
+            return build(*args)
+
+    def construct_tree(self, L: int) -> Tuple[int, List[range]]:
+        """
+        Построить узлы Γ(L), не трогая состояние машины (trees, курсор, буфер).
+        Возвращает (корень, диапазоны адресов по уровням) для install_tree.
+        Можно вызывать из фонового потока, пока машина обрабатывает биты.
+        """
+        return self._traced_build(self._construct_tree, L, L=L, N=2**L)
 
+    def _construct_tree(self, L: int) -> Tuple[int, List[range]]:
+        if self._can_extend_to(2**L):
+            return self._extend_in_place(2**L, {'L': L})
 
-    def _collect_all_nodes(self, node: MemoryCell, path_to_node: Dict[str, MemoryCell], current_path: str):
-        """Сбор всех узлов для построения ссылок"""
-        if not node: return
-        path_key = node.content.get('path_key', current_path)
-        path_to_node[path_key] = node
+        root_payload = {'L': L, 'path_key': ''} if self.debug_payload else {'L': L}
+        root = self.memory.allocate_block([0], [root_payload]).start
+        levels = [range(root, root + 1)]
+        self._extend_levels(levels, 2**L)
+        self._count_construction(L)
+        return root, levels
 
-        for label, child in node.pointers.items():
-            if child and label not in ['S']:
-                self._collect_all_nodes(child, path_to_node, path_key + label)
+    @staticmethod
+    def canonical_levels(L: int) -> List[range]:
+        """
+        Уровни Γ(L) в каноническом (кучевом) размещении: корень — адрес 0,
+        уровень d занимает адреса 2^d - 1 .. 2^(d+1) - 2. Так лежит дерево,
+        построенное в пустой памяти (в том числе достроенное на месте).
+        """
+        return [range(2**d - 1, 2**(d + 1) - 1) for d in range(2**L + 1)]
+
+    def is_canonical(self) -> bool:
+        """В памяти одно дерево, размещённое канонически"""
+        if len(self.trees) + len(self.windows) != 1:
+            return False
+        levels = self._deepest_tree()[1]
+        return (len(self.memory) == 2 ** len(levels) - 1
+                and all(level.start == 2**d - 1 for d, level in enumerate(levels)))
+
+    def install_tree(self, L: int, root: int, levels: List[range],
+                     memory: Optional[GraphAddressSpace] = None):
+        """
+        Сделать построенное Γ(L) текущим деревом машины.
+        memory — если дерево лежит в другой памяти (например, загружено из кэша).
+        Курсор переживает замену памяти, только если обе раскладки канонические:
+        тогда у узла с тем же путём тот же адрес.
+        """
+        if memory is not None and memory is not self.memory:
+            self._replace_memory(memory, root)
+        self._leave_automaton(levels)
+        if self.expansion == 'in_place':
+            # Нижние деревья после достройки уже не являются Γ(l)
+            self._forget_trees()
+        self.trees[L] = root
+        self.levels[L] = levels
+        self._activate(L)
+
+    def _replace_memory(self, memory: GraphAddressSpace, root: int):
+        keep_cursor = (self.is_canonical() or not (self.trees or self.windows)) and root == 0
+        self.memory = memory
+        self._forget_trees()
+        if not keep_cursor:
+            self.current_path_node = None
+            self._walker = None
+
+    def _forget_trees(self):
+        self.trees = {}
+        self.levels = {}
+        self.windows = {}
+        self.window_levels = {}
+
+    def _leave_automaton(self, levels: List[range]):
+        """Перенести курсор сжатого автомата на тот же путь в новом дереве"""
+        if self.automaton is None:
+            return
+        # Лист j автомата — j-й узел уровня N в любом дереве, построенном по уровням
+        N = self.automaton.N
+        if self.current_path_node is not None and len(levels) > N:
+            self.current_path_node = levels[N][self.current_path_node]
+        else:
+            self.current_path_node = None
+        self.automaton = None
 
-    def _build_suffix_links(self, L: int, root_node: MemoryCell):
-        """Построение ссылок 'S' за экспоненциальное время T_L"""
-        path_to_node: Dict[str, MemoryCell] = {}
-        self._collect_all_nodes(root_node, path_to_node, '')
+    def build_tree_Gamma(self, L: int, workers: Optional[int] = None):
+        """
+        Фаза Конструирования (Construction Phase).
+        workers — строить на пуле процессов (parallel_build.py), если память
+        машины можно заменить; иначе обычное построение.
+        """
+        if workers is not None and can_build_parallel(self, 2**L):
+            memory, root, levels = self.construct_parallel(2**L, workers, {'L': L})
+            self.install_tree(L, root, levels, memory=memory)
+            return self.trees[L]
+        root, levels = self.construct_tree(L)
+        self.install_tree(L, root, levels)
+        return self.trees[L]
 
-        for path_key, node in path_to_node.items():
-            if not path_key: continue
-            suffix_key = path_key[1:]
-            target_node = path_to_node.get(suffix_key)
+    def construct_parallel(self, depth: int, workers: Optional[int] = None,
+                           root_content: Optional[Dict[str, Any]] = None,
+                           min_nodes: Optional[int] = None) -> Tuple[GraphAddressSpace, int, List[range]]:
+        """
+        Построить бор глубины depth в новой памяти на пуле процессов.
+        Возвращает (память, корень, уровни) для install_tree / install_window;
+        stats учитываются так же, как при обычном построении.
+        min_nodes — порог размера дерева для пула (см. parallel_build).
+        """
+        inst = self.instrumentation
+        if inst is not None:
+            inst.emit(BUILD_START, in_place=self._can_extend_to(depth), parallel=True,
+                      L=root_content.get('L') if root_content else None, N=depth)
+        with inst.phase('construct-parallel') if inst is not None else nullcontext():
+            memory, root, levels = construct_parallel(depth, workers, min_nodes)
+        if root_content:
+            memory.set_content(root, dict(root_content, label=0))
+
+        # Счётчики — как у _extend_levels плюс учёт построения (_count_construction, окна, достройки)
+        deepest = self._deepest_tree()
+        old = 2 ** len(deepest[1]) - 1 if deepest is not None else 0
+        edges = len(memory) - old - (old == 0)
+        self.stats['edges_created'] += edges
+        if deepest is None and root_content and 'L' in root_content:
+            self._count_construction(root_content['L'])
+        else:
+            self.stats['nodes_created'] += len(memory) - old
+            self.stats['edges_created'] += edges
+        return memory, root, levels
 
-            if target_node:
-                self.memory.add_pointer(node.address, 'S', target_node.address)
-                self.stats['edges_created'] += 1
-            elif not suffix_key:
+    def construct_window(self, N: int) -> Tuple[int, List[range]]:
+        """
+        Построить бор чётности глубины ровно N со ссылками 'S' (окно любого
+        размера, а не только 2^L). Как construct_tree, состояние машины не трогает.
+        """
+        if N < 1:
+            raise ValueError(f"Window size must be positive, got {N}")
+        return self._traced_build(self._construct_window, N, L=None, N=N)
+
+    def _construct_window(self, N: int) -> Tuple[int, List[range]]:
+        if self._can_extend_to(N):
+            return self._extend_in_place(N, {'N': N})
+
+        created = len(self.memory)
+        root_payload = {'N': N, 'path_key': ''} if self.debug_payload else {'N': N}
+        root = self.memory.allocate_block([0], [root_payload]).start
+        levels = [range(root, root + 1)]
+        self._extend_levels(levels, N)
+        created = len(self.memory) - created
+        self.stats['nodes_created'] += created
+        self.stats['edges_created'] += created - 1
+        return root, levels
+
+    def install_window(self, N: int, root: int, levels: List[range],
+                       memory: Optional[GraphAddressSpace] = None):
+        """Сделать бор окна N текущим деревом машины (аналог install_tree)"""
+        if memory is not None and memory is not self.memory:
+            self._replace_memory(memory, root)
+        self._leave_automaton(levels)
+        if self.expansion == 'in_place':
+            self._forget_trees()
+        self.windows[N] = root
+        self.window_levels[N] = levels
+        self.exact_window = N
+        self._activate_target(N)
+
+    def build_window(self, N: int, workers: Optional[int] = None) -> int:
+        """
+        Машина для окна ровно N бит. Бор глубины N — это 2^(N+1) - 1 узлов,
+        поэтому окно 9 вместо округлённого до 16 в 128 раз меньше по памяти.
+        Для N = 2^L то же, что build_tree_Gamma(L); workers — как там.
+        """
+        if N >= 1 and N & (N - 1) == 0:
+            return self.build_tree_Gamma(N.bit_length() - 1, workers)
+        if workers is not None and N >= 1 and can_build_parallel(self, N):
+            memory, root, levels = self.construct_parallel(N, workers, {'N': N})
+            self.install_window(N, root, levels, memory=memory)
+            return root
+        root, levels = self.construct_window(N)
+        self.install_window(N, root, levels)
+        return root
+
+    def _activate(self, L: int):
+        """Сделать Γ(L) целевым деревом машины"""
+        self.current_L = L
+        self.exact_window = None
+        self._activate_target(2**L)
+
+    def _activate_target(self, N: int):
+        if self.instrumentation is not None:
+            L = self.current_L if self.exact_window is None else None
+            self.instrumentation.emit(LEVEL_READY, L=L, N=N, nodes=len(self.memory))
+        # Окно больше max_window: дальше кольцо растёт, но старые биты уже потеряны
+        self.input_buffer.resize(max(self.input_buffer.capacity, N))
+        if self.seamless and self.current_path_node is not None:
+            # Старый курсор продолжает отвечать, пока новый не догонит поток
+            buffer = self.input_buffer
+            start = max(buffer.first, buffer.total - N)
+            self._walker = _Handoff(self.target_root, N, start)
+        else:
+            self.current_path_node = None
+            self._walker = None
+            self.window_size = N
+
+    def _advance_walker(self, walker: _Handoff) -> int:
+        """Продвинуть поиск окна в целевом дереве не более чем на HANDOFF_BUDGET операций"""
+        mem = self.memory
+        buffer = self.input_buffer
+        stream_length = buffer.total
+        ops = 0
+        while ops < self.HANDOFF_BUDGET:
+            if walker.depth < walker.N:
+                pos = walker.start + walker.depth
+                if pos >= stream_length: break
+                walker.node = mem.follow(walker.node, self._EDGE[buffer.bit_at(pos)])
+                walker.depth += 1
+                ops += 1
+            elif walker.start + walker.N < stream_length:
+                suffix_node = mem.follow(walker.node, 'S')
+                walker.node = mem.follow(suffix_node, self._EDGE[buffer.bit_at(walker.start + walker.N)])
+                walker.start += 1
+                ops += 2
+            else:
+                break
+        return ops
+
+    def _seamless_step(self, bit: int) -> Tuple[int, str, int]:
+        """Шаг без пиков O(N): окно нового дерева ищется не больше HANDOFF_BUDGET операций за бит"""
+        walker = self._walker
+        buffer = self.input_buffer
+        if walker is None and self.current_path_node is None:
+            start = max(buffer.first, buffer.total - self.window_size)
+            walker = self._walker = _Handoff(self.target_root, self.window_size, start)
+
+        cost = 0
+        if walker is not None:
+            cost = self._advance_walker(walker)
+            walker.cost += cost
+            walker.bits += 1
+            if walker.ready(buffer.total):
+                if self.instrumentation is not None:
+                    self.instrumentation.observe_handoff(walker.N, walker.cost, walker.bits,
+                                                         initial=self.current_path_node is None)
+                self.current_path_node = walker.node
+                self.window_size = walker.N
+                self._walker = None
+                return self.memory.get_label(walker.node), "Real-Time (O(1))", cost
 
-                self.memory.add_pointer(node.address, 'S', root_node.address)
-                self.stats['edges_created'] += 1
+        if self.current_path_node is None:
+            return 0, "Buffering", max(cost, 1)
 
-    def build_tree_Gamma(self, L: int):
-        """Фаза Конструирования (Construction Phase)"""
-        if L == 0:
-            root = self.memory.allocate(content={'label': 0, 'L': 0, 'path_key': ''})
-            left = self.memory.allocate(content={'label': 0, 'type': 'leaf', 'path_key': '0'})
-            right = self.memory.allocate(content={'label': 1, 'type': 'leaf', 'path_key': '1'})
-            self.memory.add_pointer(root.address, '0', left.address)
-            self.memory.add_pointer(root.address, '1', right.address)
-
-            self.trees[0] = root
-            self.stats['nodes_created'] += 3
-            self.stats['edges_created'] += 2
-        else:
-            prev_L = L - 1
-            base_root = self.copy_subtree(self.trees[prev_L], xor_mask=0, prefix='')
-            leaves = self._collect_leaves(base_root)
-            template_tree = self.trees[prev_L]
+        res, msg, step_cost = self._real_time_step(bit)
+        if walker is not None and msg.startswith("Real-Time"):
+            msg = f"Handoff ({walker.depth}/{walker.N})"
+        return res, msg, step_cost + cost
 
-            for leaf in leaves:
-                leaf_val = leaf.content.get('label', 0)
-                prefix = leaf.content.get('path_key', '')
-                extension_root = self.copy_subtree(template_tree, xor_mask=leaf_val, prefix=prefix)
-                for label, child_node in extension_root.pointers.items():
-                    if label not in ['S']:
-                        self.memory.add_pointer(leaf.address, label, child_node.address)
-                if leaf.content: leaf.content['type'] = 'node'
+    def enable_instrumentation(self, tracer: Optional[Tracer] = None,
+                               trace_steps: bool = False) -> Instrumentation:
+        """
+        Включить таймеры фаз, гистограмму стоимости бита и трассировку.
+        Шаг по биту оборачивается только на этом экземпляре, поэтому без
+        инструментирования process_bit_step не платит ничего.
+        """
+        inst = self.instrumentation = Instrumentation(tracer, trace_steps)
+        step = type(self).process_bit_step.__get__(self)
 
-            self.trees[L] = base_root
+        def instrumented_step(bit: int) -> Tuple[int, str, int]:
+            result = step(bit)
+            inst.observe_step(bit, result)
+            return result
 
+        self.process_bit_step = instrumented_step
+        return inst
 
-        self._build_suffix_links(L, self.trees[L])
-        self.current_L = L
-        
-        self.current_path_node = None 
-        return self.trees[L]
+    def disable_instrumentation(self):
+        self.instrumentation = None
+        self.__dict__.pop('process_bit_step', None)
 
     def process_bit_step(self, bit: int) -> Tuple[int, str, int]:
         """
         Обработка одного бита. Возвращает (Результат, Сообщение, Стоимость).
         """
         self.input_buffer.append(bit)
-        L = self.current_L
-        N = 2**L
+        if self.automaton is not None:
+            return self._automaton_step(bit)
+        if self.seamless:
+            return self._seamless_step(bit)
+        N = self.target_N
         
         
         if len(self.input_buffer) < N:
@@ -154,32 +575,226 @@ class KolmogorovUspenskyMachine:
         
         if self.current_path_node is None:
             route = self.input_buffer[-N:]
-            current = self.trees[L]
+            current = self.target_root
             cost = 0
             for b in route:
-                current = current.pointers.get(str(b))
+                current = self.memory.follow(current, str(b))
                 cost += 1
-                if not current: return 0, "Error: Path not found", cost
+                if current is None: return 0, "Error: Path not found", cost
 
             self.current_path_node = current
-            res = current.content.get('label', 0)
+            res = self.memory.get_label(current)
             return res, "Init (O(N))", cost
 
-        
-        
-        suffix_node = self.current_path_node.pointers.get('S')
-        if not suffix_node: return 0, "Error: S-link missing", 1
-
-
-        next_node = suffix_node.pointers.get(str(bit))
-        if not next_node: return 0, "Error: Add-link missing", 2
+        return self._real_time_step(bit)
+
+    def _real_time_step(self, bit: int) -> Tuple[int, str, int]:
+        """Шаг реального времени: переход по 'S' и затем по ребру нового бита"""
+        mem = self.memory
+        if isinstance(mem, ArrayAddressSpace):
+            # Столбцовая память: два перехода — два обращения по индексу
+            suffix_node = mem.suffix[self.current_path_node]
+            if suffix_node < 0: return 0, "Error: S-link missing", 1
+            next_node = mem.children[bit][suffix_node]
+            if next_node < 0: return 0, "Error: Add-link missing", 2
+        else:
+            suffix_node = mem.follow(self.current_path_node, 'S')
+            if suffix_node is None: return 0, "Error: S-link missing", 1
+            next_node = mem.follow(suffix_node, str(bit))
+            if next_node is None: return 0, "Error: Add-link missing", 2
 
         self.current_path_node = next_node
         self.operations += 2
 
-        res = next_node.content.get('label', 0)
+        res = mem.get_label(next_node)
         return res, "Real-Time (O(1))", 2
 
+    def compact_steady_state(self) -> SteadyAutomaton:
+        """
+        Сжать текущее дерево в автомат установившегося режима (см. steady.py)
+        и отпустить граф. Следующий build_tree_Gamma строит дерево заново
+        в пустой памяти, а курсор переносится на тот же путь в новом дереве.
+        """
+        if self._walker is not None:
+            raise RuntimeError("Cannot compact while a level handoff is in progress")
+        levels = self.target_levels
+        automaton = SteadyAutomaton.from_machine(self, levels)
+        if self.current_path_node is not None:
+            self.current_path_node -= levels[-1].start
+        self.memory = type(self.memory)()
+        self._forget_trees()
+        self.stride_table = None
+        self.automaton = automaton
+        return automaton
+
+    def _automaton_step(self, bit: int) -> Tuple[int, str, int]:
+        """Шаг сжатого автомата: один переход по индексу"""
+        automaton = self.automaton
+        if self.current_path_node is None:
+            if len(self.input_buffer) < automaton.N:
+                return 0, "Buffering", 1
+            # Начальное окно — прямой индекс, без спуска от корня
+            self.current_path_node = automaton.state_for_window(self.input_buffer[-automaton.N:])
+            return automaton.label(self.current_path_node), "Init (index)", 1
+
+        self.current_path_node = automaton.next[bit][self.current_path_node]
+        self.operations += 1
+        return automaton.label(self.current_path_node), "Real-Time (O(1))", 1
+
+    def process_bits(self, buffer, packed: bool = False) -> Tuple[bytearray, Dict[str, int]]:
+        """
+        Пакетная обработка: buffer — bytes, bytearray, массив NumPy или список
+        бит 0/1. Возвращает (выходы по байту на бит, сводные счётчики стоимости);
+        с packed=True выходы упакованы как в process_packed (старший бит первый).
+        Результаты совпадают с поочерёдными вызовами process_bit_step.
+        Переходные шаги (буферизация, поиск окна) идут через скалярный путь,
+        установившийся режим — плотный цикл без объектов на каждый бит.
+        """
+        data = as_bit_buffer(buffer)
+        n = len(data)
+        outputs = bytearray(n)
+        totals = {'bits': n, 'cost': 0, 'max_cost': 0, 'operations': 0, 'real_time_bits': 0}
+
+        pos = 0
+        while pos < n:
+            if self.current_path_node is None or self._walker is not None:
+                res, _, cost = self.process_bit_step(data[pos])
+                outputs[pos] = res
+                totals['cost'] += cost
+                totals['max_cost'] = max(totals['max_cost'], cost)
+                pos += 1
+                continue
+
+            end = self._steady_run(data, pos, outputs)
+            steps = end - pos
+            step_cost = 1 if self.automaton is not None else 2
+            if steps:
+                # В окно входа копируются только биты, которые в нём останутся
+                kept = self.input_buffer.skip(steps)
+                self.input_buffer.extend(data[end - kept:end])
+                self.operations += step_cost * steps
+                totals['cost'] += step_cost * steps
+                totals['operations'] += step_cost * steps
+                totals['real_time_bits'] += steps
+                totals['max_cost'] = max(totals['max_cost'], step_cost)
+                if self.instrumentation is not None:
+                    self.instrumentation.record_cost(step_cost, steps)
+            if end < n and steps == 0:
+                # Битая ссылка: отдаём бит скалярному пути, он сообщит об ошибке
+                res, _, cost = self.process_bit_step(data[end])
+                outputs[end] = res
+                totals['cost'] += cost
+                totals['max_cost'] = max(totals['max_cost'], cost)
+                end += 1
+            pos = end
+        if packed:
+            outputs = pack_msb(outputs)
+        return outputs, totals
+
+    def _steady_run(self, data, start: int, outputs: bytearray) -> int:
+        """
+        Плотный цикл установившегося режима с позиции start.
+        Возвращает позицию, на которой остановился (len(data) или битая ссылка).
+        """
+        mem = self.memory
+        node = self.current_path_node
+        i = start
+        n = len(data)
+        if self.automaton is not None:
+            next0, next1 = self.automaton.next
+            labels = self.automaton.labels
+            while i < n:
+                node = next1[node] if data[i] else next0[node]
+                outputs[i] = (labels[node >> 3] >> (node & 7)) & 1
+                i += 1
+        elif isinstance(mem, ArrayAddressSpace):
+            suffix = mem.suffix
+            child0, child1 = mem.children
+            labels = mem.labels
+            while i < n:
+                s = suffix[node]
+                if s < 0: break
+                nxt = child1[s] if data[i] else child0[s]
+                if nxt < 0: break
+                node = nxt
+                outputs[i] = (labels[node >> 3] >> (node & 7)) & 1
+                i += 1
+        else:
+            follow = mem.follow
+            get_label = mem.get_label
+            edge = self._EDGE
+            while i < n:
+                s = follow(node, 'S')
+                if s is None: break
+                nxt = follow(s, edge[data[i]])
+                if nxt is None: break
+                node = nxt
+                outputs[i] = get_label(node)
+                i += 1
+        self.current_path_node = node
+        return i
+
+    def build_stride_table(self, k: int = 8) -> StrideTable:
+        """Предпостроить переходы на k бит для текущего Γ(L) (см. stride.py)"""
+        self.stride_table = StrideTable(self, k)
+        return self.stride_table
+
+    def process_packed(self, data, nbits: Optional[int] = None) -> Tuple[bytearray, Dict[str, int]]:
+        """
+        Пакетная обработка упакованного входа: по 8 бит в байте, старший бит первый.
+        nbits — сколько бит брать (по умолчанию все). Выходы упакованы так же.
+        В установившемся режиме с подходящей stride_table целые байты идут
+        одним-двумя обращениями к таблице; остальное — через process_bit_step.
+        """
+        data = memoryview(data).cast('B')
+        n = 8 * len(data) if nbits is None else nbits
+        outputs = bytearray((n + 7) // 8)
+        totals = {'bits': n, 'cost': 0, 'max_cost': 0, 'operations': 0,
+                  'real_time_bits': 0, 'stride_lookups': 0}
+        table = self.stride_table
+
+        pos = 0
+        while pos < n:
+            stop = n >> 3
+            if (pos & 7 == 0 and pos >> 3 < stop and self._walker is None
+                    and table is not None and table.covers(self)):
+                start = pos >> 3
+                self.current_path_node = table.run(self.current_path_node, data, outputs, start, stop)
+                steps = 8 * (stop - start)
+                step_cost = 1 if self.automaton is not None else 2
+                # В окно входа распаковываются только биты, которые в нём останутся
+                kept = self.input_buffer.skip(steps)
+                self.input_buffer.extend(unpack_msb(data, 8 * stop - kept, 8 * stop))
+                self.operations += step_cost * steps
+                totals['cost'] += step_cost * steps
+                totals['operations'] += step_cost * steps
+                totals['real_time_bits'] += steps
+                totals['max_cost'] = max(totals['max_cost'], step_cost)
+                if self.instrumentation is not None:
+                    self.instrumentation.record_cost(step_cost, steps)
+                totals['stride_lookups'] += (stop - start) * (8 // table.k)
+                pos = 8 * stop
+                continue
+
+            res, msg, cost = self.process_bit_step(bit_of(data, pos))
+            if res:
+                outputs[pos >> 3] |= 0x80 >> (pos & 7)
+            totals['cost'] += cost
+            totals['max_cost'] = max(totals['max_cost'], cost)
+            if msg.startswith("Real-Time"):
+                totals['operations'] += cost
+                totals['real_time_bits'] += 1
+            pos += 1
+        return outputs, totals
+
+    def shared_graph(self, L: Optional[int] = None) -> GammaGraph:
+        """
+        Γ(L) как общий граф для многих потоков (см. streams.StreamCursor).
+        После достройки на месте (expansion='in_place') представление остаётся
+        верным: узлы глубины <= 2^L и их ссылки не меняются.
+        """
+        return GammaGraph.from_machine(self, L)
+
     def visualize_tree_ascii(self, L: int):
         """Вывод дерева в консоль"""
         if L not in self.trees: return
@@ -187,25 +802,26 @@ class KolmogorovUspenskyMachine:
         print(f"\n--- Граф Памяти Γ({L}), Окно N={2**L} ---")
 
         def print_node(node, prefix="", is_last=True, edge_lbl=None):
-            if not node: return
+            if node is None: return
+            pointers = self.memory.pointers(node)
             connector = "└── " if is_last else "├── "
-            lbl_str = f"[{node.content.get('label')}]"
+            lbl_str = f"[{self.memory.get_label(node)}]"
             edge_str = f"{edge_lbl} → " if edge_lbl is not None else "[Root] "
 
 
-            is_leaf = '0' not in node.pointers and '1' not in node.pointers
+            is_leaf = '0' not in pointers and '1' not in pointers
             color = "\033[92m" if is_leaf else "" 
             reset = "\033[0m"
             
             
-            s_link = " (S→...)" if 'S' in node.pointers else ""
+            s_link = " (S→...)" if 'S' in pointers else ""
 
             print(f"{prefix}{connector}{edge_str}{color}{lbl_str}{s_link}{reset}")
 
             children = []
             for k in ['0', '1']:
-                if k in node.pointers and node.pointers[k]:
-                    children.append((k, node.pointers[k]))
+                if pointers.get(k) is not None:
+                    children.append((k, pointers[k]))
 
             child_prefix = prefix + ("    " if is_last else "│   ")
             for i, (k, child) in enumerate(children):
@@ -213,3 +829,126 @@ class KolmogorovUspenskyMachine:
 
         print_node(root)
         print("-" * 40)
+
+
+class ImplicitGammaMachine:
+    """
+    Неявное представление Γ(L) без хранимых ссылок.
+
+    Узел задаётся номером в куче: корень — 1, ребёнок по биту b — 2v + b,
+    т.е. биты номера после старшей единицы и есть путь до узла.
+    Отсюда метка — чётность пути (popcount без старшей единицы),
+    а ссылка 'S' (путь без первого бита) — маска и сдвиг.
+    Построение Γ(L) стоит O(1), шаг реального времени — те же две операции KUM.
+    """
+    ROOT = 1
+
+    def __init__(self, max_window: int = KolmogorovUspenskyMachine.MAX_WINDOW):
+        self.current_L = 0
+        self.operations = 0
+        self.trees: Dict[int, int] = {}
+        # Как у KolmogorovUspenskyMachine: кольцо сразу на самое большое окно
+        self.max_window = max_window
+        self.input_buffer = BitWindow(max_window)
+        self.current_path_node: Optional[int] = None
+        self.demo_mode = False
+        self.stats = {
+            'nodes_created': 0,
+            'edges_created': 0,
+            'traversals': 0
+        }
+        self._top = 1
+        self._mask = 0
+
+    @staticmethod
+    def depth(node: int) -> int:
+        return node.bit_length() - 1
+
+    @staticmethod
+    def child(node: int, bit: int) -> int:
+        """Переход по ребру '0' / '1'"""
+        return (node << 1) | bit
+
+    @staticmethod
+    def label(node: int) -> int:
+        """Чётность пути: число единиц без маркера корня"""
+        return (node.bit_count() - 1) & 1
+
+    @staticmethod
+    def suffix(node: int) -> Optional[int]:
+        """Ссылка 'S': путь без первого бита"""
+        d = node.bit_length() - 1
+        if d == 0:
+            return None
+        top = 1 << (d - 1)
+        return (node & (top - 1)) | top
+
+    def node_for_path(self, bits) -> int:
+        node = self.ROOT
+        for b in bits:
+            node = (node << 1) | int(b)
+        return node
+
+    def build_tree_Gamma(self, L: int):
+        """Фаза Конструирования: для неявного дерева — только параметры окна"""
+        N = 2**L
+        self._top = 1 << (N - 1)
+        self._mask = self._top - 1
+        self.trees[L] = self.ROOT
+        self.current_L = L
+        self.current_path_node = None
+        self.input_buffer.resize(max(self.input_buffer.capacity, N))
+        return self.ROOT
+
+    def process_bit_step(self, bit: int) -> Tuple[int, str, int]:
+        """
+        Обработка одного бита. Возвращает (Результат, Сообщение, Стоимость).
+        """
+        self.input_buffer.append(bit)
+        N = 2**self.current_L
+
+        if len(self.input_buffer) < N:
+            return 0, "Buffering", 1
+
+        if self.current_path_node is None:
+            self.current_path_node = self.node_for_path(self.input_buffer[-N:])
+            return self.label(self.current_path_node), "Init (O(N))", N
+
+        suffix_node = (self.current_path_node & self._mask) | self._top
+        next_node = (suffix_node << 1) | bit
+
+        self.current_path_node = next_node
+        self.operations += 2
+        return self.label(next_node), "Real-Time (O(1))", 2
+
+    def verify_materialized(self, machine: KolmogorovUspenskyMachine, L: int) -> List[str]:
+        """
+        Сверка построенного Γ(L) с неявным: обходит дерево машины и проверяет
+        метку и ссылку 'S' каждого узла. Возвращает список расхождений.
+        """
+        errors = []
+        memory = machine.memory
+        root = machine.trees[L]
+        addr_to_node = {root: self.ROOT}
+        q = [root]
+        while q:
+            addr = q.pop()
+            node = addr_to_node[addr]
+            if memory.get_label(addr) != self.label(node):
+                errors.append(f"label mismatch at {bin(node)[3:] or 'root'}")
+            for b in (0, 1):
+                child = memory.follow(addr, str(b))
+                if child is not None:
+                    addr_to_node[child] = self.child(node, b)
+                    q.append(child)
+        for addr, node in addr_to_node.items():
+            expected = self.suffix(node)
+            actual = memory.follow(addr, 'S')
+            if expected is None:
+                if actual is not None:
+                    errors.append("root has an S-link")
+            elif actual is None or addr_to_node.get(actual) != expected:
+                errors.append(f"S-link mismatch at {bin(node)[3:]}")
+        if len(addr_to_node) != 2 ** (2**L + 1) - 1:
+            errors.append(f"node count {len(addr_to_node)}")
+        return errors
@@ -1,7 +1,19 @@
+import sys
+
+from bitwindow import BitWindow
+from render import Renderer, format_tape
+
+
 class RealTimeTuringMachine:
 
-    def __init__(self, verbose=True):
-        self.tape = []  # Бесконечная лента
+    def __init__(self, verbose=True, full_history=False, renderer=None):
+        # Демонстрация печатает только окно и запас вокруг него, поэтому
+        # хватает кольца из N+1 ячеек (окно + вытесняемый бит) плюс запас;
+        # full_history=True — хранить всю ленту
+        self.full_history = full_history
+        # Без своего рендерера каждый кадр печатается сразу
+        self.renderer = renderer if renderer is not None else Renderer(refresh_hz=0)
+        self.tape = BitWindow(1, keep_history=self.full_history)  # Лента
         self.head_position = -1  # Текущая позиция головки
         self.current_xor = 0  # Текущее значение предиката (XOR окна)
         self.L = 0  # Уровень иерархии
@@ -13,42 +25,32 @@ class RealTimeTuringMachine:
         """Инициализация параметров окна перед началом работы."""
         self.L = L
         self.window_size = 2 ** L
-        self.tape = []
+        margin = self.renderer.margin if self.verbose else 0
+        self.tape = BitWindow(self.window_size + 1 + margin, keep_history=self.full_history)
         self.head_position = -1
         self.current_xor = 0
         self.bit_index = 0
 
         if self.verbose:
-            print(f"\n{'=' * 60}")
-            print(f"{' УРОВЕНЬ L=' + str(L) + ' | РАЗМЕР ОКНА N=' + str(self.window_size) + ' ':^60}")
-            print(f"{'=' * 60}")
-            print("Вводи биты (0 или 1). Для выхода на выбор L введи 'q'.\n")
-
-    def _print_tape(self, highlight_window=True, leaving_bit_pos=None):
-        """Визуализация состояния ленты и положения головки."""
-        if not self.verbose: return
-        if not self.tape:
-            print("Лента: <пусто>")
-            return
-
-        tape_parts = []
-        for i, bit in enumerate(self.tape):
-            if highlight_window and len(self.tape) >= self.window_size:
-                start = len(self.tape) - self.window_size
-                if start <= i < len(self.tape):
-                    tape_parts.append(f"[{bit}]") 
-                else:
-                    if leaving_bit_pos is not None and i == leaving_bit_pos:
-                        tape_parts.append(f"({bit})")  
-                    else:
-                        tape_parts.append(f" {bit} ")  
-            else:
-                tape_parts.append(f" {bit} ")
-
-        tape_str = "".join(tape_parts)
-        head_spaces = "   " * self.head_position
-        print(f"Лента: {tape_str}")
-        print(f"Голова:{head_spaces} ↑ (позиция {self.head_position})")
+            self.renderer.message(
+                f"\n{'=' * 60}\n"
+                f"{' УРОВЕНЬ L=' + str(L) + ' | РАЗМЕР ОКНА N=' + str(self.window_size) + ' ':^60}\n"
+                f"{'=' * 60}\n"
+                "Вводи биты (0 или 1). Для выхода на выбор L введи 'q'.\n")
+
+    def _format_tape(self, highlight_window=True, leaving_bit_pos=None) -> str:
+        """Лента (только окно и запас перед ним) и положение головки."""
+        if not self.tape.total:
+            return "Лента: <пусто>"
+        tape_str, offset = format_tape(self.tape, self.window_size, self.renderer.margin,
+                                       highlight_window, leaving_bit_pos)
+        # Ячейка — 3 символа; многоточие скрытого начала — ещё один
+        head_spaces = " " * (offset > 0) + "   " * (self.head_position - offset)
+        return f"Лента: {tape_str}\nГолова:{head_spaces} ↑ (позиция {self.head_position})"
+
+    @staticmethod
+    def _header(idx: int, bit: int) -> str:
+        return f"\n{'-' * 50}\nОбработка бита {idx} | Ввод: {bit}\n{'-' * 50}"
 
     def steps_per_bit(self, bit_index: int) -> int:
         """
@@ -70,10 +72,6 @@ class RealTimeTuringMachine:
         self.bit_index += 1
         idx = self.bit_index - 1
 
-        if self.verbose:
-            print(f"\n{'-' * 50}")
-            print(f"Обработка бита {idx} | Ввод: {bit}")
-            print(f"{'-' * 50}")
 
         #Запись нового бита на ленту
         self.tape.append(bit)
@@ -81,27 +79,34 @@ class RealTimeTuringMachine:
         steps = 1
 
         # Окно еще заполняется
-        if len(self.tape) < self.window_size:
+        if self.tape.total < self.window_size:
             self.current_xor ^= bit
             if self.verbose:
-                print("Состояние: окно заполняется")
-                self._print_tape(highlight_window=False)
-                print(f"Прогресс: {len(self.tape)}/{self.window_size} | Шаги: {steps} | Вывод: 0")
+                self.renderer.frame(lambda: "\n".join((
+                    self._header(idx, bit),
+                    "Состояние: окно заполняется",
+                    self._format_tape(highlight_window=False),
+                    f"Прогресс: {self.tape.total}/{self.window_size} | Шаги: {steps} | Вывод: 0",
+                )), bit=idx, xor=0)
             return 0
 
             # Окно только что заполнилось (граничный случай)
-        if len(self.tape) == self.window_size:
+        if self.tape.total == self.window_size:
             self.current_xor ^= bit
             if self.verbose:
-                print("СОБЫТИЕ: Окно полностью заполнено!")
-                self._print_tape()
-                print(f"Текущий XOR окна: {self.current_xor}")
-                print(f"Шаги: {steps} | Вывод: {self.current_xor}")
+                xor = self.current_xor
+                self.renderer.frame(lambda: "\n".join((
+                    self._header(idx, bit),
+                    "СОБЫТИЕ: Окно полностью заполнено!",
+                    self._format_tape(),
+                    f"Текущий XOR окна: {xor}",
+                    f"Шаги: {steps} | Вывод: {xor}",
+                )), bit=idx, xor=xor)
             return self.current_xor
 
 
         leaving_pos = self.head_position - self.window_size
-        leaving_bit = self.tape[leaving_pos]
+        leaving_bit = self.tape.bit_at(leaving_pos)
 
         distance = self.window_size
         steps += distance + 1 + distance
@@ -112,15 +117,18 @@ class RealTimeTuringMachine:
         new_xor = after_leaving ^ bit
 
         if self.verbose:
-            print(f"Нужно обновить XOR: вытесняется бит на позиции {leaving_pos}")
-            self._print_tape(leaving_bit_pos=leaving_pos)
-            print(f"\nОбновление XOR (имитация внутренней логики):")
-            print(f"   Старый XOR       : {old_xor}")
-            print(f" ⊕ Вытесняемый бит  : {leaving_bit} (считан после перемещения)")
-            print(f"   =                {after_leaving}")
-            print(f" ⊕ Новый бит        : {bit}")
-            print(f"   = Новый XOR      : {new_xor}")
-            print(f"ИТОГО ШАГОВ ГОЛОВКИ : {steps} (Формула 2N + 2)")
+            self.renderer.frame(lambda: "\n".join((
+                self._header(idx, bit),
+                f"Нужно обновить XOR: вытесняется бит на позиции {leaving_pos}",
+                self._format_tape(leaving_bit_pos=leaving_pos),
+                "\nОбновление XOR (имитация внутренней логики):",
+                f"   Старый XOR       : {old_xor}",
+                f" ⊕ Вытесняемый бит  : {leaving_bit} (считан после перемещения)",
+                f"   =                {after_leaving}",
+                f" ⊕ Новый бит        : {bit}",
+                f"   = Новый XOR      : {new_xor}",
+                f"ИТОГО ШАГОВ ГОЛОВКИ : {steps} (Формула 2N + 2)",
+            )), bit=idx, xor=new_xor)
 
         self.current_xor = new_xor
         return self.current_xor
@@ -128,7 +136,8 @@ class RealTimeTuringMachine:
 
 def interactive_mode():
     """Интерфейс для ручного тестирования и наглядной демонстрации."""
-    tm = RealTimeTuringMachine(verbose=True)
+    summary = '--summary' in sys.argv
+    tm = RealTimeTuringMachine(verbose=True, renderer=Renderer('summary' if summary else 'full'))
 
     while True:
         try:
@@ -147,10 +156,13 @@ def interactive_mode():
                 if user_input.lower() in ['q', 'quit', 'exit', '']:
                     print("Возвращаемся к выбору уровня...\n")
                     break
-                if user_input not in ['0', '1']:
+                if set(user_input) - {'0', '1'}:
                     print("Только 0 или 1!")
                     continue
-                tm.process_bit(int(user_input))
+                # Вставленную строку бит печатаем с прореживанием, в конце — итог
+                for char in user_input:
+                    tm.process_bit(int(char))
+                tm.renderer.flush()
 
         except ValueError:
             print("Введи число!")
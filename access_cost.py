@@ -0,0 +1,247 @@
+"""
+Эмуляция неидеальной памяти: стоимость доступа между ячейками графа.
+
+В модели Колмогорова–Успенского переход по ссылке стоит 1. Здесь же
+доступ к ячейке без прямой ссылки стоит (кратчайшее число переходов + 1),
+по прямой ссылке — memory.access_cost, к самой себе — 1.
+
+Анализатор считает расстояния поиском в ширину за O(узлов + ссылок),
+хранит найденные расстояния до первого изменения ссылок (memory.version
+растёт с каждым add_pointer), отвечает на пачку запросов одним поиском
+на источник, а для бора чётности с ссылками 'S' умеет считать расстояние
+без поиска по индексу уровней (GammaDistanceIndex).
+"""
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict, deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+INF = float('inf')
+
+
+class GammaDistanceIndex:
+    """
+    Расстояния в полном боре с ссылками 'S', построенном по уровням.
+
+    Узел глубины d — путь p из d бит; '0'/'1' дописывают бит в конец,
+    'S' отбрасывает первый. Кратчайший путь от p к q: отбросить начало p,
+    пока остаток не станет началом q, и дописать недостающее. Если m —
+    длина самого длинного конца p, совпадающего с началом q, то расстояние
+    равно len(p) + len(q) - 2m. Путь узла — его номер на уровне.
+    """
+
+    def __init__(self, levels: Sequence[range]):
+        self.levels = list(levels)
+        self._starts = [level.start for level in self.levels]
+
+    def locate(self, address: int) -> Optional[Tuple[int, int]]:
+        """(глубина, путь как число) или None, если адрес не из этого дерева"""
+        d = bisect_right(self._starts, address) - 1
+        if d < 0 or address not in self.levels[d]:
+            return None
+        return d, address - self._starts[d]
+
+    def distance(self, from_addr: int, to_addr: int) -> Optional[int]:
+        a, b = self.locate(from_addr), self.locate(to_addr)
+        if a is None or b is None:
+            return None
+        (dp, p), (dq, q) = a, b
+        for m in range(min(dp, dq), -1, -1):
+            # Последние m бит p против первых m бит q
+            if p & ((1 << m) - 1) == q >> (dq - m):
+                return dp + dq - 2 * m
+        return dp + dq
+
+
+class AccessCostAnalyzer:
+    """
+    Стоимости доступа для одного адресного пространства.
+
+    cost(a, b) — одна пара; costs(pairs) — пачка, по одному поиску на источник;
+    path_cost(addresses) — суммарная стоимость маршрута (например, курсора за прогон).
+    max_sources — сколько полных карт расстояний держать в кэше.
+    """
+
+    def __init__(self, memory, max_sources: int = 64):
+        self.memory = memory
+        self.max_sources = max_sources
+        self.index: Optional[GammaDistanceIndex] = None
+        self._index_version = -1
+        self._version = memory.version
+        self._access_cost = memory.access_cost
+        self._maps: 'OrderedDict[int, Dict[int, int]]' = OrderedDict()
+        self._pairs: Dict[Tuple[int, int], float] = {}
+        self.stats = {'queries': 0, 'cache_hits': 0, 'index_hits': 0, 'searches': 0, 'visited': 0}
+
+    def build_index(self, levels: Sequence[range]) -> GammaDistanceIndex:
+        """
+        Индекс для бора с уровнями levels. Действует, пока в памяти не
+        добавлено ни одной ссылки: после этого запросы снова идут поиском.
+        """
+        self.index = GammaDistanceIndex(levels)
+        self._index_version = self.memory.version
+        return self.index
+
+    def _sync(self):
+        """Сбросить кэш, если ссылки менялись"""
+        version = self.memory.version
+        if version != self._version or self.memory.access_cost != self._access_cost:
+            self._version = version
+            self._access_cost = self.memory.access_cost
+            self._maps.clear()
+            self._pairs.clear()
+        if self.index is not None and self._index_version != version:
+            self.index = None
+
+    def _neighbors(self):
+        """Функция соседей: у столбцовой памяти — прямо из столбцов, без словарей ссылок"""
+        memory = self.memory
+        if not hasattr(memory, 'suffix'):
+            return lambda address: memory.pointers(address).values()
+        (child0, child1), suffix, extra = memory.children, memory.suffix, memory.extra_pointers
+
+        def neighbors(address: int) -> List[int]:
+            found = [target for target in (child0[address], child1[address], suffix[address]) if target >= 0]
+            if extra and address in extra:
+                found.extend(extra[address].values())
+            return found
+        return neighbors
+
+    def _search(self, source: int, targets: Optional[set] = None) -> Dict[int, int]:
+        """
+        Поиск в ширину от source; ячейка помечается при постановке в очередь,
+        поэтому каждая обрабатывается один раз. С targets поиск останавливается,
+        как только найдены все цели.
+        """
+        self.stats['searches'] += 1
+        dist = {source: 0}
+        queue = deque((source,))
+        remaining = set(targets) - {source} if targets is not None else None
+        neighbors = self._neighbors()
+        while queue and (remaining is None or remaining):
+            cell = queue.popleft()
+            step = dist[cell] + 1
+            for neighbor in neighbors(cell):
+                if neighbor not in dist:
+                    dist[neighbor] = step
+                    queue.append(neighbor)
+                    if remaining is not None:
+                        remaining.discard(neighbor)
+        self.stats['visited'] += len(dist)
+        if remaining is None:
+            self._maps[source] = dist
+            self._maps.move_to_end(source)
+            while len(self._maps) > self.max_sources:
+                self._maps.popitem(last=False)
+        return dist
+
+    def distances_from(self, source: int) -> Dict[int, int]:
+        """Все достижимые из source ячейки и число переходов до них"""
+        self._sync()
+        cached = self._maps.get(source)
+        if cached is not None:
+            self._maps.move_to_end(source)
+            return cached
+        return self._search(source)
+
+    def _direct(self, from_addr: int, to_addr: int) -> bool:
+        return to_addr in self.memory.pointers(from_addr).values()
+
+    def _finish(self, from_addr: int, to_addr: int, hops: Optional[int]) -> float:
+        """Стоимость по расстоянию: прямая ссылка — access_cost, иначе переходы + 1"""
+        if self._direct(from_addr, to_addr):
+            return self.memory.access_cost
+        return hops + 1 if hops is not None else INF
+
+    def _known(self, from_addr: int, to_addr: int) -> Optional[float]:
+        """Ответ без поиска: из кэша пар, полной карты или индекса"""
+        memory = self.memory
+        if memory.get_cell(from_addr) is None or memory.get_cell(to_addr) is None:
+            return INF
+        pair = (from_addr, to_addr)
+        if pair in self._pairs:
+            self.stats['cache_hits'] += 1
+            return self._pairs[pair]
+        dist = self._maps.get(from_addr)
+        if dist is not None:
+            self.stats['cache_hits'] += 1
+            cost = self._finish(from_addr, to_addr, dist.get(to_addr))
+        elif self.index is not None:
+            hops = self.index.distance(from_addr, to_addr)
+            if hops is None:
+                return None
+            self.stats['index_hits'] += 1
+            cost = self._finish(from_addr, to_addr, hops)
+        else:
+            return None
+        self._pairs[pair] = cost
+        return cost
+
+    def cost(self, from_addr: int, to_addr: int) -> float:
+        """Стоимость доступа from_addr -> to_addr (inf, если недостижимо)"""
+        self._sync()
+        self.stats['queries'] += 1
+        known = self._known(from_addr, to_addr)
+        if known is not None:
+            return known
+        if self._direct(from_addr, to_addr):
+            cost = self.memory.access_cost
+        else:
+            cost = self._finish(from_addr, to_addr, self._search(from_addr, {to_addr}).get(to_addr))
+        self._pairs[(from_addr, to_addr)] = cost
+        return cost
+
+    def costs(self, pairs: Iterable[Tuple[int, int]]) -> List[float]:
+        """
+        Стоимости для пачки пар. Неизвестные пары группируются по источнику,
+        и на каждый источник выполняется один поиск до всех его целей.
+        """
+        self._sync()
+        pairs = list(pairs)
+        self.stats['queries'] += len(pairs)
+        results: List[Optional[float]] = [self._known(a, b) for a, b in pairs]
+        pending: Dict[int, List[int]] = defaultdict(list)
+        for i, (a, b) in enumerate(pairs):
+            if results[i] is None:
+                pending[a].append(i)
+
+        for source, indices in pending.items():
+            targets = {pairs[i][1] for i in indices}
+            dist = self._search(source, targets)
+            for i in indices:
+                target = pairs[i][1]
+                results[i] = self._pairs[(source, target)] = self._finish(source, target, dist.get(target))
+        return results
+
+    def path_cost(self, addresses: Sequence[Optional[int]]) -> Dict[str, float]:
+        """
+        Суммарная стоимость маршрута по соседним парам адресов (None пропускается,
+        как и переход в ту же ячейку не считается отдельным доступом)
+        """
+        pairs = [(a, b) for a, b in zip(addresses, addresses[1:])
+                 if a is not None and b is not None and a != b]
+        values = self.costs(pairs)
+        total = sum(values)
+        return {
+            'accesses': len(values),
+            'total': total,
+            'mean': total / len(values) if values else 0.0,
+            'max': max(values, default=0.0),
+        }
+
+
+def measure_run(machine, bits: Iterable[int], analyzer: Optional[AccessCostAnalyzer] = None) -> Dict[str, float]:
+    """
+    Прогнать биты через машину KUM и оценить стоимость всех переходов курсора
+    в неидеальной памяти. Если дерево — бор по уровням, расстояния берутся из индекса.
+    """
+    if machine.automaton is not None:
+        raise ValueError("Cursor of a compacted steady-state automaton is a leaf index, not an address")
+    if analyzer is None:
+        analyzer = AccessCostAnalyzer(machine.memory)
+        if machine.trees or machine.windows:
+            analyzer.build_index(machine.target_levels)
+    cursor = [machine.current_path_node]
+    for bit in bits:
+        machine.process_bit_step(bit)
+        cursor.append(machine.current_path_node)
+    return analyzer.path_cost(cursor)
@@ -0,0 +1,161 @@
+"""
+Активная зона памяти, поддерживаемая на ходу.
+
+Зона — ячейки, достижимые из активных не более чем за radius переходов.
+Вместо обхода с нуля на каждый запрос для каждой активной ячейки хранится
+её шар (ячейка -> расстояние), а для каждой ячейки зоны — множество
+активных, в чьи шары она входит (счётчик ссылок). Поэтому размер зоны
+и принадлежность ячейки — O(1), а изменения стоят столько, сколько
+ячеек в затронутых шарах:
+  * activate / deactivate — обход шара одной ячейки;
+  * новая ссылка u -> v — дообход от v только для шаров, где u ближе radius;
+  * замена ссылки (старая цель пропадает) — пересчёт затронутых шаров.
+"""
+from collections import deque
+from typing import Dict, Iterable, Iterator, Optional, Set
+
+
+class ActiveZone:
+    """Зона радиуса radius вокруг активных ячеек памяти memory (по адресам)"""
+
+    def __init__(self, memory, radius: int = 3):
+        self.memory = memory
+        self.radius = radius
+        self.balls: Dict[int, Dict[int, int]] = {}
+        self.members: Dict[int, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def __contains__(self, address: int) -> bool:
+        return address in self.members
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.members)
+
+    def refcount(self, address: int) -> int:
+        """Сколько активных ячеек дотягиваются до address"""
+        sources = self.members.get(address)
+        return len(sources) if sources else 0
+
+    def _ball(self, source: int) -> Dict[int, int]:
+        pointers = self.memory.pointers
+        ball = {source: 0}
+        queue = deque((source,))
+        while queue:
+            cell = queue.popleft()
+            d = ball[cell]
+            if d == self.radius:
+                continue
+            for neighbor in pointers(cell).values():
+                if neighbor not in ball:
+                    ball[neighbor] = d + 1
+                    queue.append(neighbor)
+        return ball
+
+    def _add_member(self, address: int, source: int):
+        sources = self.members.get(address)
+        if sources is None:
+            self.members[address] = {source}
+        else:
+            sources.add(source)
+
+    def _drop_member(self, address: int, source: int):
+        sources = self.members[address]
+        sources.discard(source)
+        if not sources:
+            del self.members[address]
+
+    def activate(self, address: int):
+        if address in self.balls:
+            return
+        ball = self.balls[address] = self._ball(address)
+        for cell in ball:
+            self._add_member(cell, address)
+
+    def deactivate(self, address: int):
+        ball = self.balls.pop(address, None)
+        if ball is None:
+            return
+        for cell in ball:
+            self._drop_member(cell, address)
+
+    def move(self, old: Optional[int], new: Optional[int]):
+        """Перенести активность с old на new (курсор машины за один шаг)"""
+        if old == new:
+            return
+        if new is not None:
+            self.activate(new)
+        if old is not None:
+            self.deactivate(old)
+
+    def _affected(self, address: int) -> Iterable[int]:
+        """Активные, у которых address лежит строго внутри шара (из него можно шагнуть)"""
+        return [s for s in self.members.get(address, ()) if self.balls[s][address] < self.radius]
+
+    def pointer_added(self, from_addr: int, to_addr: int, replaced: Optional[int] = None):
+        """
+        Учесть ссылку from_addr -> to_addr. replaced — прежняя цель той же
+        метки, если ссылка перезаписана: тогда расстояния могут вырасти,
+        и затронутые шары пересчитываются целиком.
+        """
+        affected = self._affected(from_addr)
+        if replaced is not None and replaced != to_addr:
+            for source in affected:
+                self.deactivate(source)
+                self.activate(source)
+            return
+        for source in affected:
+            ball = self.balls[source]
+            start = ball[from_addr] + 1
+            queue = deque(((to_addr, start),))
+            while queue:
+                cell, d = queue.popleft()
+                known = ball.get(cell)
+                if known is not None and known <= d:
+                    continue
+                if known is None:
+                    self._add_member(cell, source)
+                ball[cell] = d
+                if d < self.radius:
+                    queue.extend((neighbor, d + 1) for neighbor in self.memory.pointers(cell).values())
+
+    def remap(self, remap: Dict[int, int]):
+        """Память перенумерована (compact): перевести активные ячейки и пересчитать шары"""
+        sources = [remap[source] for source in self.balls if source in remap]
+        self.balls.clear()
+        self.members.clear()
+        for source in sources:
+            self.activate(source)
+
+    def rebuild(self):
+        """Пересчитать все шары (после изменений памяти в обход add_pointer)"""
+        sources = list(self.balls)
+        self.balls.clear()
+        self.members.clear()
+        for source in sources:
+            self.activate(source)
+
+
+def track_run(machine, bits: Iterable[int], radius: int = 3) -> Dict[str, float]:
+    """
+    Прогнать биты через машину KUM, держа активной ячейку курсора,
+    и собрать размеры активной зоны по шагам
+    """
+    if machine.automaton is not None:
+        raise ValueError("Cursor of a compacted steady-state automaton is a leaf index, not an address")
+    zone = ActiveZone(machine.memory, radius)
+    cursor = machine.current_path_node
+    zone.move(None, cursor)
+    sizes = []
+    for bit in bits:
+        machine.process_bit_step(bit)
+        zone.move(cursor, machine.current_path_node)
+        cursor = machine.current_path_node
+        sizes.append(len(zone))
+    return {
+        'steps': len(sizes),
+        'mean_zone': sum(sizes) / len(sizes) if sizes else 0.0,
+        'max_zone': max(sizes, default=0),
+        'final_zone': len(zone),
+    }
@@ -0,0 +1,299 @@
+"""
+Безголовый бэнчмарк: время построения, задержка на бит, пропускная
+способность и пиковая память для каждого L и каждого движка.
+
+Результат — JSON или CSV, чтобы сравнивать прогоны между коммитами.
+Графики необязательны, matplotlib загружается только для --plot.
+
+    python benchmark.py --levels 0-4 --bits 5000 --repeats 5 --format csv
+    python compare.py benchmark --engines kum,mt --output results.json
+"""
+import argparse
+import csv
+import io
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from KUM import KolmogorovUspenskyMachine
+from MT import RealTimeTuringMachine
+from memory import ArrayAddressSpace, GraphAddressSpace
+from parallel_build import available_cpus, warm_pool
+from xor_engine import PrefixXorEngine, sliding_xor
+
+# Движки: шаговые обрабатывают по биту за вызов, остальные — порциями по chunk бит.
+# kum-heap и kum-parallel отличаются от kum только построением: дерево заполняется
+# по формулам канонического размещения (parallel_build.py) — kum-heap в своём
+# процессе, kum-parallel всегда на пуле из workers процессов (строка на каждое число)
+ENGINES = ('kum', 'kum-graph', 'kum-heap', 'kum-parallel', 'kum-batch', 'kum-packed', 'kum-steady', 'mt', 'xor')
+FIELDS = ('engine', 'L', 'N', 'workers', 'bits', 'repeats', 'chunk_bits', 'build_s', 'throughput_bps',
+          'latency_p50_ns', 'latency_p99_ns', 'latency_max_ns', 'peak_kib', 'nodes', 'correct')
+
+
+def _pack(bits: bytes) -> bytes:
+    """Байты-биты -> упакованные байты, старший бит первый"""
+    out = bytearray((len(bits) + 7) // 8)
+    for i, bit in enumerate(bits):
+        if bit:
+            out[i >> 3] |= 0x80 >> (i & 7)
+    return bytes(out)
+
+
+def _unpack(data: bytes, n: int) -> bytes:
+    return bytes((data[i >> 3] >> (7 - (i & 7))) & 1 for i in range(n))
+
+
+def _kum(L: int, memory=ArrayAddressSpace, workers: Optional[int] = None) -> KolmogorovUspenskyMachine:
+    """
+    Машина с Γ(L). С workers дерево заполняется по формулам: при workers=1 в
+    своём процессе, иначе на пуле независимо от его оценки выгоды (min_nodes=0)
+    """
+    machine = KolmogorovUspenskyMachine(memory(), expansion='in_place')
+    if workers is None:
+        machine.build_tree_Gamma(L)
+    else:
+        tree_memory, root, levels = machine.construct_parallel(2**L, workers, {'L': L}, min_nodes=0)
+        machine.install_tree(L, root, levels, memory=tree_memory)
+    return machine
+
+
+# Перевод порции в формат движка и его выходов обратно в байты-биты; вне замера времени
+Codec = Tuple[Callable[[bytes], Any], Callable[[Any, int], bytes]]
+
+
+def _setup(engine: str, L: int, workers: Optional[int] = None) -> Tuple[Callable[[Any], bytes], int, Optional[int], Optional[Codec]]:
+    """
+    Построить движок. Возвращает (обработать порцию -> выходы, размер порции,
+    число узлов графа или None, кодек или None). С кодеком порции готовятся
+    заранее, а выходы распаковываются после замера: время — только движка.
+    """
+    if engine in ('kum', 'kum-graph', 'kum-heap', 'kum-parallel'):
+        memory = GraphAddressSpace if engine == 'kum-graph' else ArrayAddressSpace
+        machine = _kum(L, memory, {'kum-heap': 1, 'kum-parallel': workers}.get(engine))
+        step = machine.process_bit_step
+        return (lambda chunk: bytes((step(chunk[0])[0],))), 1, len(machine.memory), None
+    if engine == 'kum-batch':
+        machine = _kum(L)
+        return (lambda chunk: machine.process_bits(chunk)[0]), 0, len(machine.memory), None
+    if engine == 'kum-packed':
+        machine = _kum(L)
+        machine.build_stride_table(8)
+        # Вход упаковывается один раз до замера, как если бы он уже пришёл упакованным
+        codec = (lambda chunk: (_pack(chunk), len(chunk))), _unpack
+        return (lambda packed: machine.process_packed(*packed)[0]), 0, len(machine.memory), codec
+    if engine == 'kum-steady':
+        machine = _kum(L)
+        machine.compact_steady_state()
+        return (lambda chunk: machine.process_bits(chunk)[0]), 0, len(machine.automaton), None
+    if engine == 'mt':
+        tm = RealTimeTuringMachine(verbose=False)
+        tm.set_L(L)
+        return (lambda chunk: bytes((tm.process_bit(chunk[0]),))), 1, None, None
+    if engine == 'xor':
+        xor = PrefixXorEngine(L)
+        return (lambda chunk: bytes(xor.process_bits(chunk))), 0, None, None
+    raise ValueError(f"Unknown engine: {engine}")
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Процентиль q (0..100) по ближайшему рангу"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def _run_once(engine: str, L: int, bits: bytes, chunk: int, workers: Optional[int] = None):
+    """Один прогон: (построение в с, прогон в с, задержки на бит в нс, выходы, порция, узлы)"""
+    start = time.perf_counter()
+    process, size, nodes, codec = _setup(engine, L, workers)
+    build = time.perf_counter() - start
+    size = size or chunk
+
+    parts = [bits[pos:pos + size] for pos in range(0, len(bits), size)]
+    inputs = [codec[0](part) for part in parts] if codec is not None else parts
+    latencies = []
+    results = []
+    elapsed = 0
+    clock = time.perf_counter_ns
+    for part, data in zip(parts, inputs):
+        t0 = clock()
+        out = process(data)
+        t1 = clock() - t0
+        elapsed += t1
+        latencies.append(t1 / len(part))
+        results.append(out)
+    outputs = bytearray()
+    for part, out in zip(parts, results):
+        outputs += codec[1](out, len(part)) if codec is not None else out
+    return build, elapsed / 1e9, latencies, outputs, size, nodes
+
+
+def _peak_kib(engine: str, L: int, bits: bytes, chunk: int, workers: Optional[int] = None) -> float:
+    """Пик памяти построения и прогона; отдельным проходом, чтобы tracemalloc не искажал время"""
+    tracemalloc.start()
+    try:
+        _run_once(engine, L, bits, chunk, workers)
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_engine(engine: str, L: int, bits: bytes, repeats: int = 3, chunk: int = 256,
+                     workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Замер одного движка на одном L: медианы по repeats прогонам.
+    Для пакетных движков задержка на бит — время порции, делённое на её длину.
+    Пул kum-parallel запускается до замера: он один на процесс, как в машине.
+    """
+    builds, throughputs, latencies = [], [], []
+    correct = True
+    expected = bytes(sliding_xor(bits, 2**L))
+    if engine == 'kum-parallel' and workers > 1:
+        warm_pool(workers)
+    for _ in range(repeats):
+        build, elapsed, lat, outputs, size, nodes = _run_once(engine, L, bits, chunk, workers)
+        builds.append(build)
+        throughputs.append(len(bits) / max(1e-9, elapsed))
+        latencies.extend(lat)
+        correct = correct and bytes(outputs) == expected
+    return {
+        'engine': engine,
+        'L': L,
+        'N': 2**L,
+        'workers': workers if engine == 'kum-parallel' else (1 if engine == 'kum-heap' else None),
+        'bits': len(bits),
+        'repeats': repeats,
+        'chunk_bits': size,
+        'build_s': statistics.median(builds),
+        'throughput_bps': statistics.median(throughputs),
+        'latency_p50_ns': percentile(latencies, 50),
+        'latency_p99_ns': percentile(latencies, 99),
+        'latency_max_ns': max(latencies),
+        'peak_kib': _peak_kib(engine, L, bits, chunk, workers),
+        'nodes': nodes,
+        'correct': correct,
+    }
+
+
+def default_workers() -> List[int]:
+    """Числа процессов для kum-parallel: степени двойки до числа ядер (хотя бы 2)"""
+    cores = available_cpus()
+    counts = [2]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if cores > counts[-1]:
+        counts.append(cores)
+    return counts
+
+
+def run_suite(levels: Sequence[int], engines: Sequence[str] = ENGINES, num_bits: int = 5000,
+              repeats: int = 3, chunk: int = 256, seed: int = 42,
+              workers: Optional[Sequence[int]] = None) -> List[Dict[str, Any]]:
+    """Все движки на всех L; kum-parallel — по строке на каждое число процессов из workers"""
+    rng = random.Random(seed)
+    bits = bytes(rng.randint(0, 1) for _ in range(num_bits))
+    workers = list(workers) if workers else default_workers()
+    return [benchmark_engine(engine, L, bits, repeats, chunk, w)
+            for L in levels for engine in engines
+            for w in (workers if engine == 'kum-parallel' else [None])]
+
+
+def to_json(records: List[Dict[str, Any]], meta: Dict[str, Any]) -> str:
+    return json.dumps({'meta': meta, 'results': records}, indent=2, ensure_ascii=False)
+
+
+def to_csv(records: List[Dict[str, Any]]) -> str:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerows(records)
+    return out.getvalue()
+
+
+def plot_results(records: List[Dict[str, Any]], path: Optional[str] = None):
+    """Графики пропускной способности и p99 по L; matplotlib грузится только здесь"""
+    import matplotlib
+    if path is not None:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, (ax_tp, ax_lat) = plt.subplots(1, 2, figsize=(12, 5))
+    for engine in dict.fromkeys(r['engine'] for r in records):
+        rows = [r for r in records if r['engine'] == engine]
+        Ls = [r['L'] for r in rows]
+        ax_tp.plot(Ls, [r['throughput_bps'] for r in rows], 'o-', label=engine)
+        ax_lat.plot(Ls, [r['latency_p99_ns'] for r in rows], 'o-', label=engine)
+    for ax, title, unit in ((ax_tp, 'Пропускная способность', 'бит/с'),
+                            (ax_lat, 'Задержка на бит, p99', 'нс')):
+        ax.set_title(title)
+        ax.set_xlabel('Уровень L')
+        ax.set_ylabel(unit)
+        ax.set_yscale('log')
+        ax.grid(True, alpha=0.3)
+        ax.legend()
+    fig.tight_layout()
+    if path is not None:
+        fig.savefig(path)
+    else:
+        plt.show()
+
+
+def parse_levels(text: str) -> List[int]:
+    """'0-4' или '0,2,3' -> список уровней"""
+    levels = []
+    for part in text.split(','):
+        if '-' in part:
+            lo, hi = part.split('-')
+            levels.extend(range(int(lo), int(hi) + 1))
+        elif part:
+            levels.append(int(part))
+    return levels
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Бэнчмарк KUM, МТ и быстрых режимов")
+    parser.add_argument('--levels', default='0-4', help="уровни L: '0-4' или '0,2,3'")
+    parser.add_argument('--engines', default=','.join(ENGINES), help="через запятую из: " + ', '.join(ENGINES))
+    parser.add_argument('--bits', type=int, default=5000, help="длина входного потока")
+    parser.add_argument('--repeats', type=int, default=3, help="повторов на движок и L")
+    parser.add_argument('--chunk', type=int, default=256, help="размер порции для пакетных движков")
+    parser.add_argument('--workers', default=None,
+                        help="процессов пула для kum-parallel через запятую (по умолчанию 2, 4, ... до числа ядер)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--format', choices=('json', 'csv'), default='json')
+    parser.add_argument('--output', help="файл результата (по умолчанию stdout)")
+    parser.add_argument('--plot', nargs='?', const='', default=None,
+                        help="построить графики (с путём — сохранить в файл)")
+    args = parser.parse_args(argv)
+
+    engines = [e for e in args.engines.split(',') if e]
+    unknown = set(engines) - set(ENGINES)
+    if unknown:
+        parser.error(f"unknown engines: {', '.join(sorted(unknown))}")
+
+    workers = [int(w) for w in args.workers.split(',') if w] if args.workers else None
+    records = run_suite(parse_levels(args.levels), engines, args.bits, args.repeats, args.chunk,
+                        args.seed, workers)
+    meta = {'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': available_cpus(), 'bits': args.bits, 'repeats': args.repeats, 'seed': args.seed}
+    text = to_json(records, meta) if args.format == 'json' else to_csv(records)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+    if args.plot is not None:
+        plot_results(records, args.plot or None)
+    return 0 if all(r['correct'] for r in records) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
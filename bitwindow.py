@@ -0,0 +1,159 @@
+from typing import Iterable, Iterator, List, Optional
+
+# Байты-биты 0/1 -> цифры '0'/'1', чтобы упаковывать их через int(..., 2) целиком
+_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+
+
+def as_bit_buffer(buffer) -> memoryview:
+    """Привести вход (bytes, bytearray, NumPy, список 0/1) к плоскому буферу байт-бит"""
+    if hasattr(buffer, 'astype'):
+        buffer = buffer.astype('uint8').tobytes()
+    elif not isinstance(buffer, (bytes, bytearray, memoryview)):
+        buffer = bytes(buffer)
+    return memoryview(buffer).cast('B')
+
+
+def pack_msb(bits) -> bytearray:
+    """Байты-биты, упакованные по 8 в байт старшим битом вперёд (хвост дополнен нулями)"""
+    n = len(bits)
+    if not n:
+        return bytearray()
+    pad = -n % 8
+    value = int(bytes(bits).translate(_DIGITS), 2) << pad
+    return bytearray(value.to_bytes((n + pad) // 8, 'big'))
+
+
+class BitWindow:
+    """
+    Окно последних capacity бит потока: кольцевой буфер, по биту на бит.
+
+    Обычные индексы [] считаются от начала хранимой части окна
+    (отрицательные — с конца, как у списка), bit_at(pos) — по абсолютному
+    номеру бита в потоке. total — сколько бит пришло за всё время.
+    С keep_history=True хранится вся история (для демонстраций, печатающих ленту).
+    """
+
+    def __init__(self, capacity: int, keep_history: bool = False):
+        self.capacity = max(1, capacity)
+        self.keep_history = keep_history
+        self.total = 0
+        self.first = 0  # Абсолютный номер самого старого хранимого бита
+        self._bits = bytearray((self.capacity + 7) // 8)
+        self._history: Optional[List[int]] = [] if keep_history else None
+
+    def append(self, bit: int):
+        """Добавить бит; самый старый бит вытесняется, если окно полно"""
+        if self._history is not None:
+            self._history.append(bit)
+        else:
+            self._set(self.total % self.capacity, bit)
+            if self.total - self.first == self.capacity:
+                self.first += 1
+        self.total += 1
+
+    def _set(self, slot: int, bit: int):
+        if bit:
+            self._bits[slot >> 3] |= 1 << (slot & 7)
+        else:
+            self._bits[slot >> 3] &= ~(1 << (slot & 7)) & 0xFF
+
+    def _store(self, bits, slot: int):
+        """
+        Записать бит-байты bits в ячейки slot.. без перехода через конец кольца:
+        невыровненные края по биту, середину — целыми байтами за одно преобразование
+        """
+        n = len(bits)
+        pos = 0
+        while pos < n and (slot + pos) & 7:
+            self._set(slot + pos, bits[pos])
+            pos += 1
+        whole = (n - pos) >> 3
+        if whole:
+            chunk = bytes(bits[pos:pos + 8 * whole])
+            # Бит i числа — chunk[i], поэтому little-endian кладёт его в ячейку slot + pos + i
+            value = int(chunk.translate(_DIGITS)[::-1], 2)
+            start = (slot + pos) >> 3
+            self._bits[start:start + whole] = value.to_bytes(whole, 'little')
+            pos += 8 * whole
+        while pos < n:
+            self._set(slot + pos, bits[pos])
+            pos += 1
+
+    def extend(self, bits: Iterable[int]):
+        """
+        Добавить много бит; в кольцо пишутся только последние capacity из них,
+        целыми байтами (не больше двух кусков: до конца кольца и с его начала)
+        """
+        if self._history is not None:
+            self._history.extend(bits)
+            self.total = len(self._history)
+            return
+        bits = bits if isinstance(bits, (bytes, bytearray, list, memoryview)) else list(bits)
+        skipped = len(bits) - self.capacity
+        if skipped > 0:
+            self.total += skipped
+            self.first = self.total
+            bits = bits[skipped:]
+        n = len(bits)
+        slot = self.total % self.capacity
+        head = min(n, self.capacity - slot)
+        self._store(bits[:head], slot)
+        self._store(bits[head:], 0)
+        self.total += n
+        self.first = max(self.first, self.total - self.capacity)
+
+    def skip(self, count: int) -> int:
+        """
+        Подготовиться к приходу count бит, не распаковывая те, что всё равно
+        будут вытеснены. Возвращает, сколько последних бит нужно передать в extend.
+        """
+        if self._history is not None:
+            return count
+        skipped = count - self.capacity
+        if skipped > 0:
+            self.total += skipped
+            self.first = self.total
+            return self.capacity
+        return count
+
+    def bit_at(self, pos: int) -> int:
+        """Бит с абсолютным номером pos (IndexError, если он уже вытеснен)"""
+        if not self.first <= pos < self.total:
+            raise IndexError(f"bit {pos} is outside the window [{self.first}, {self.total})")
+        if self._history is not None:
+            return self._history[pos]
+        slot = pos % self.capacity
+        return (self._bits[slot >> 3] >> (slot & 7)) & 1
+
+    def resize(self, capacity: int):
+        """Изменить ёмкость, сохранив последние min(len, capacity) бит"""
+        capacity = max(1, capacity)
+        if capacity == self.capacity:
+            return
+        kept = self[-capacity:] if self._history is None else []
+        self.capacity = capacity
+        if self._history is None:
+            self._bits = bytearray((capacity + 7) // 8)
+            self.first = self.total = self.total - len(kept)
+            self.extend(kept)
+
+    def __len__(self) -> int:
+        return self.total - self.first
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            first = self.first
+            return [self.bit_at(first + i) for i in range(*index.indices(len(self)))]
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("BitWindow index out of range")
+        return self.bit_at(self.first + index)
+
+    def __iter__(self) -> Iterator[int]:
+        for pos in range(self.first, self.total):
+            yield self.bit_at(pos)
+
+    def __repr__(self):
+        return f"BitWindow(capacity={self.capacity}, total={self.total}, bits={''.join(map(str, self))})"
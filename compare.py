@@ -1,10 +1,11 @@
 import random
 import time
-import matplotlib.pyplot as plt
 import sys
 from typing import List
 from KUM import KolmogorovUspenskyMachine
 from MT import RealTimeTuringMachine
+from scheduler import BackgroundBuilder
+import benchmark
 
 def run_benchmark(num_bits: int = 500, max_L: int = 4):
     random.seed(42)
@@ -14,8 +15,8 @@ def run_benchmark(num_bits: int = 500, max_L: int = 4):
     print(f"АВТОМАТИЧЕСКИЙ БЭНЧМАРК: {num_bits} битов, L от 0 до {max_L}")
     print(f"{'=' * 80}")
     print(
-        f"{'L':<4} {'N':<8} {'Время стр. (с)':<18} {'Узлы':<12} {'Оп. KUM (на бит)':<20} {'Шаги МТ (на бит)':<20}")
-    print("-" * 95)
+        f"{'L':<4} {'N':<8} {'Время стр. (с)':<18} {'мкс/узел':<10} {'Узлы':<12} {'Оп. KUM (на бит)':<20} {'Макс. оп. KUM':<15} {'Шаги МТ (на бит)':<20}")
+    print("-" * 120)
 
     L_values = list(range(max_L + 1))
     build_times = []
@@ -32,9 +33,11 @@ def run_benchmark(num_bits: int = 500, max_L: int = 4):
             if level not in kum.trees:
                 kum.build_tree_Gamma(level)
         build_time = time.time() - start
+        us_per_node = build_time / max(1, len(kum.memory)) * 1e6
 
         kum_results = []
         kum_ops_total = 0
+        kum_ops_max = 0
         inputs_since_build = 0
         for bit in bits:
             xor_val, _, cost = kum.process_bit_step(bit)
@@ -45,6 +48,7 @@ def run_benchmark(num_bits: int = 500, max_L: int = 4):
 
             kum_results.append(xor_val)
             kum_ops_total += cost
+            kum_ops_max = max(kum_ops_max, cost)
 
         tm = RealTimeTuringMachine()
         # В MT.py метод set_L выводит много текста в консоль
@@ -56,12 +60,18 @@ def run_benchmark(num_bits: int = 500, max_L: int = 4):
         avg_tm = sum(tm.steps_per_bit(i + 1) for i in range(num_bits)) / real_time_bits
 
         print(
-            f"{L:<4} {N:<8} {build_time:<18.4f} {kum.stats['nodes_created']:<12} {avg_kum:<20.2f} {avg_tm:<20.2f} ")
+            f"{L:<4} {N:<8} {build_time:<18.4f} {us_per_node:<10.2f} {kum.stats['nodes_created']:<12} {avg_kum:<20.2f} {kum_ops_max:<15} {avg_tm:<20.2f} ")
 
         build_times.append(build_time)
         nodes_list.append(kum.stats['nodes_created'])
         kum_ops_avg.append(avg_kum)
         tm_steps_avg.append(avg_tm)
+
+    run_expansion_benchmark(bits, max_L)
+    run_window_benchmark(bits, [3, 5, 6, 9])
+
+    # Графики нужны только этому наглядному прогону; безголовый — benchmark.py
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(12, 5))
 
     plt.subplot(1, 2, 1)
@@ -90,10 +100,61 @@ def run_benchmark(num_bits: int = 500, max_L: int = 4):
     plt.tight_layout()
     plt.show()
 
+def run_expansion_benchmark(bits: List[int], max_L: int):
+    """
+    Прогон с автоматическими расширениями L = 0 -> max_L (как в interface.py):
+    худшая стоимость бита с повторным проходом окна и с переносом курсора.
+    """
+    print(f"\nРасширения во время потока (L до {max_L}):")
+    print(f"{'Режим':<28} {'Макс. оп. на бит':<18} {'Оп. KUM (на бит)':<18}")
+    for seamless in (False, True):
+        kum = KolmogorovUspenskyMachine(expansion='in_place', seamless=seamless)
+        kum.build_tree_Gamma(0)
+        inputs_since_build = 0
+        costs = []
+        for bit in bits:
+            _, _, cost = kum.process_bit_step(bit)
+            costs.append(cost)
+            inputs_since_build += 1
+            if kum.current_L < max_L and inputs_since_build >= 2 * 2 ** kum.current_L + 4:
+                kum.build_tree_Gamma(kum.current_L + 1)
+                inputs_since_build = 0
+        mode = "перенос курсора" if seamless else "повторный проход O(N)"
+        print(f"{mode:<28} {max(costs):<18} {sum(costs) / len(costs):<18.2f}")
+
+
+def run_window_benchmark(bits: List[int], windows: List[int]):
+    """
+    Точные окна против округления до 2^L: память и время построения
+    растут с нужным окном, а не со следующей степенью двойки.
+    """
+    print("\nТочные окна против округления до 2^L:")
+    print(f"{'N':<6} {'Узлы (точно)':<14} {'Время (с)':<12} {'Узлы (2^L)':<14} {'Время (с)':<12} {'Выходы':<10}")
+    for N in windows:
+        exact = KolmogorovUspenskyMachine()
+        start = time.time()
+        exact.build_window(N)
+        exact_time = time.time() - start
+
+        L = (N - 1).bit_length()
+        rounded = KolmogorovUspenskyMachine()
+        start = time.time()
+        rounded.build_tree_Gamma(L)
+        rounded_time = time.time() - start
+
+        outputs, _ = exact.process_bits(bits)
+        # МТ умеет только окна 2^L, поэтому сверяем с прямым XOR окна N
+        expected = [sum(bits[i - N + 1:i + 1]) % 2 if i >= N - 1 else 0 for i in range(len(bits))]
+        status = "совпадают" if list(outputs) == expected else "РАСХОЖДЕНИЕ"
+        print(f"{N:<6} {len(exact.memory):<14} {exact_time:<12.4f} {len(rounded.memory):<14} {rounded_time:<12.4f} {status:<10}")
+
+
 def interactive_compare():
     tm = RealTimeTuringMachine(verbose=False)
     kum = KolmogorovUspenskyMachine()
     kum.demo_mode = False
+    # Следующий уровень строится в фоне, пока вводятся биты текущего
+    builder = BackgroundBuilder(kum, max_L=4)
 
     print("=" * 70)
     print("   СРАВНЕНИЕ МАШИНЫ ТЬЮРИНГА И МАШИНЫ КОЛМОГОРОВА–УСПЕНСКОГО")
@@ -114,11 +175,25 @@ def interactive_compare():
         tm.set_L(L)
 
         start = time.time()
+        pending = builder.target_L
+        if pending is not None and pending <= L and pending not in kum.trees:
+            # Фоновое дерево нужно для выбранного L: дожидаемся только его,
+            # следующий уровень не запускаем, пока пользователь его не выбрал
+            print(f"Γ({pending}) строилось в фоне ({builder.progress():.0%}), дожидаемся...")
+            builder.finish(start_next=False)
+        missing = [level for level in range(L + 1) if level not in kum.trees]
+        if missing and builder.target_L is not None:
+            # Синхронное построение не должно идти параллельно с фоновым,
+            # а более глубокий уровень сейчас не нужен
+            builder.discard()
         print("Строим Γ(L)...")
-        for level in range(L + 1):
-            if level not in kum.trees:
-                kum.build_tree_Gamma(level)
+        for level in missing:
+            kum.build_tree_Gamma(level)
+        if kum.current_L != L:
+            kum.install_tree(L, kum.trees[L], kum.levels[L])
         print(f"Готово за {time.time() - start:.2f}с, узлов: {kum.stats['nodes_created']}")
+        if L + 1 not in kum.trees:
+            builder.start(L + 1)
 
         if L <= 3:
             kum.visualize_tree_ascii(L)
@@ -134,7 +209,7 @@ def interactive_compare():
             bit = int(user_in)
             bit_count += 1
 
-            tm_xor = tm.process(bit)
+            tm_xor = tm.process_bit(bit)
             kum_xor, msg, cost = kum.process_bit_step(bit)
 
             steps_mt = tm.steps_per_bit(bit_count)
@@ -150,7 +225,9 @@ def interactive_compare():
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        sys.exit(benchmark.main(sys.argv[2:]))
+    elif len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
         run_benchmark(num_bits=500, max_L=4)
     else:
         interactive_compare()
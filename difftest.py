@@ -0,0 +1,557 @@
+"""
+Дифференциальное тестирование: KUM во всех режимах, МТ и векторный XOR
+против простейшего эталона на случайных и «неудобных» потоках.
+
+Сравнение побитовое, включая заполнение окна и границы расширения уровня.
+Случаи раскладываются по пулу процессов; для каждого расхождения поток
+ужимается до минимального контрпримера. Быстрый прогон годится как проверка
+перед слиянием любых изменений горячих путей:
+
+    python difftest.py                 # L = 0..3, несколько секунд
+    python difftest.py --levels 0-4 --seeds 200 --workers 8
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from KUM import KolmogorovUspenskyMachine, ImplicitGammaMachine
+from MT import RealTimeTuringMachine
+from memory import ArrayAddressSpace, GraphAddressSpace
+from scheduler import BackgroundBuilder
+from xor_engine import MultiWindowXorEngine, PrefixXorEngine
+
+# Случай — словарь (переживает pickle): kind, seed и segments = [(уровень или N, биты)].
+# 'fixed' — одно Γ(L); 'window' — точное окно N; 'expansion' — уровни L, L+1, ... по сегментам.
+Case = Dict[str, Any]
+Segments = List[Tuple[int, bytes]]
+# Движок: (сегменты, seed) -> (выходы, окна ответов по битам или None)
+Engine = Callable[[Segments, int], Tuple[List[int], Optional[List[int]]]]
+
+# Выше этого L машины берутся копией заранее построенного дерева, а не строятся заново
+TEMPLATE_FROM_L = 4
+# Найденные расхождения: прогоняются в каждом запуске вместе со случайными случаями
+REGRESSION_CASES: List[Case] = [
+    # Два расширения подряд без входа между ними: окну Γ(2) нужны биты,
+    # пришедшие ещё при Γ(0), а кольцо входа было рассчитано на 2 бита
+    {'kind': 'expansion', 'seed': 0, 'segments': [(0, [0, 1, 1, 0, 1]), (1, []), (2, [1])]},
+]
+# Процессов для движков kum-parallel. Оценка выгоды пула (parallel_build.pool_pays_off)
+# для маленьких деревьев выбрала бы заполнение в своём процессе, поэтому эти движки
+# строят с min_nodes=0: путь shared_memory проверяется на каждом уровне
+PARALLEL_WORKERS = 2
+
+
+def reference(bits: bytes, windows: Sequence[int]) -> List[int]:
+    """Эталон: XOR последних windows[t] бит, пока их набралось меньше — 0"""
+    prefix = [0]
+    for bit in bits:
+        prefix.append(prefix[-1] ^ bit)
+    return [prefix[t + 1] ^ prefix[t + 1 - w] if t + 1 >= w else 0
+            for t, w in enumerate(windows)]
+
+
+def _segment_windows(case: Case) -> List[int]:
+    if case['kind'] == 'window':
+        return [case['segments'][0][0]] * len(case['segments'][0][1])
+    return [2**L for L, bits in case['segments'] for _ in bits]
+
+
+def _built_windows(case: Case) -> List[Tuple[int, ...]]:
+    """Окна всех деревьев, построенных к каждому биту: на них может отвечать машина"""
+    if case['kind'] == 'window':
+        return [(case['segments'][0][0],)] * len(case['segments'][0][1])
+    built, result = (), []
+    for L, bits in case['segments']:
+        built += (2**L,)
+        result += [built] * len(bits)
+    return result
+
+
+def _stream(segments: Segments) -> bytes:
+    return b''.join(bits for _, bits in segments)
+
+
+@lru_cache(maxsize=None)
+def _template(L: int):
+    """Столбцы Γ(L), построенного один раз на процесс"""
+    machine = KolmogorovUspenskyMachine(ArrayAddressSpace(), expansion='in_place')
+    machine.build_tree_Gamma(L)
+    mem = machine.memory
+    return mem.child0, mem.child1, mem.suffix, mem.labels, len(mem)
+
+
+def _machine(L: int, memory=ArrayAddressSpace, expansion: str = 'in_place',
+             **kwargs) -> KolmogorovUspenskyMachine:
+    """Машина с Γ(L): до TEMPLATE_FROM_L строится по уровням 0..L, дальше — копия шаблона"""
+    machine = KolmogorovUspenskyMachine(memory(), expansion=expansion, **kwargs)
+    if L >= TEMPLATE_FROM_L and memory is ArrayAddressSpace:
+        child0, child1, suffix, labels, count = _template(L)
+        copy = ArrayAddressSpace.from_columns(array('i', child0), array('i', child1),
+                                              array('i', suffix), bytearray(labels), count)
+        machine.install_tree(L, 0, machine.canonical_levels(L), memory=copy)
+    else:
+        for level in range(L + 1):
+            machine.build_tree_Gamma(level)
+    return machine
+
+
+def _chunks(bits: bytes, seed: int) -> List[bytes]:
+    """Детерминированная нарезка на порции разной длины (включая пустые)"""
+    rng = random.Random(seed)
+    parts, pos = [], 0
+    while pos < len(bits):
+        size = rng.choice((0, 1, 2, 3, 7, 8, 9, 31, 64))
+        parts.append(bits[pos:pos + size])
+        pos += size
+    return parts
+
+
+def _pack(bits: bytes) -> bytes:
+    out = bytearray((len(bits) + 7) // 8)
+    for i, bit in enumerate(bits):
+        if bit:
+            out[i >> 3] |= 0x80 >> (i & 7)
+    return bytes(out)
+
+
+def _unpack(data: bytes, n: int) -> List[int]:
+    return [(data[i >> 3] >> (7 - (i & 7))) & 1 for i in range(n)]
+
+
+# --- Движки для одного уровня (kind='fixed') ---
+
+def _steps(machine, bits: bytes) -> List[int]:
+    return [machine.process_bit_step(bit)[0] for bit in bits]
+
+
+def _fixed_kum(segments, seed):
+    (L, bits), = segments
+    return _steps(_machine(L), bits), None
+
+
+def _pooled(machine: KolmogorovUspenskyMachine, depth: int, root_content: Dict[str, int]):
+    """(память, корень, уровни) бора глубины depth, построенного на пуле при любом размере"""
+    return machine.construct_parallel(depth, PARALLEL_WORKERS, root_content, min_nodes=0)
+
+
+def _install_pooled_tree(machine: KolmogorovUspenskyMachine, L: int):
+    memory, root, levels = _pooled(machine, 2**L, {'L': L})
+    machine.install_tree(L, root, levels, memory=memory)
+
+
+def _fixed_kum_parallel(segments, seed):
+    (L, bits), = segments
+    machine = KolmogorovUspenskyMachine(ArrayAddressSpace(), expansion='in_place')
+    _install_pooled_tree(machine, L)
+    return _steps(machine, bits), None
+
+
+def _fixed_kum_graph(segments, seed):
+    (L, bits), = segments
+    return _steps(_machine(L, GraphAddressSpace, 'rebuild'), bits), None
+
+
+def _fixed_kum_seamless(segments, seed):
+    (L, bits), = segments
+    return _steps(_machine(L, seamless=True), bits), None
+
+
+def _fixed_kum_batch(segments, seed):
+    (L, bits), = segments
+    machine = _machine(L)
+    out = []
+    for part in _chunks(bits, seed):
+        out += machine.process_bits(part)[0]
+    return out, None
+
+
+def _fixed_kum_packed(segments, seed):
+    (L, bits), = segments
+    machine = _machine(L)
+    machine.build_stride_table(8 if L < TEMPLATE_FROM_L else 4)
+    out = []
+    for part in _chunks(bits, seed):
+        out += _unpack(machine.process_packed(_pack(part), len(part))[0], len(part))
+    return out, None
+
+
+def _fixed_kum_steady(segments, seed):
+    (L, bits), = segments
+    machine = _machine(L)
+    # Сжатие посреди потока: курсор должен пережить переход к автомату
+    head = bits[:len(bits) // 3]
+    out = _steps(machine, head)
+    machine.compact_steady_state()
+    return out + _steps(machine, bits[len(head):]), None
+
+
+def _fixed_cursor(segments, seed):
+    (L, bits), = segments
+    cursor = _machine(L).shared_graph().cursor()
+    return list(cursor.advance_bits(bits)), None
+
+
+def _fixed_implicit(segments, seed):
+    (L, bits), = segments
+    machine = ImplicitGammaMachine()
+    machine.build_tree_Gamma(L)
+    return _steps(machine, bits), None
+
+
+def _fixed_mt(segments, seed):
+    (L, bits), = segments
+    tm = RealTimeTuringMachine(verbose=False)
+    tm.set_L(L)
+    return [tm.process_bit(bit) for bit in bits], None
+
+
+def _fixed_xor(segments, seed):
+    (L, bits), = segments
+    engine = PrefixXorEngine(L)
+    out = []
+    for part in _chunks(bits, seed):
+        out += engine.process_bits(part)
+    return out, None
+
+
+def _fixed_multi_xor(segments, seed):
+    (L, bits), = segments
+    engine = MultiWindowXorEngine([L, L + 1])
+    out = []
+    for i, part in enumerate(_chunks(bits, seed)):
+        # Пакетный и поштучный режимы вперемешку, на одном общем состоянии
+        if i % 2:
+            out += [engine.process_bit(bit)[L] for bit in part]
+        else:
+            out += engine.process_bits(part)[L]
+    return out, None
+
+
+# --- Точные окна (kind='window') ---
+
+def _window_kum(segments, seed):
+    (N, bits), = segments
+    machine = KolmogorovUspenskyMachine(ArrayAddressSpace(), expansion='in_place')
+    machine.build_window(N)
+    return _steps(machine, bits), None
+
+
+def _window_kum_parallel(segments, seed):
+    (N, bits), = segments
+    machine = KolmogorovUspenskyMachine(ArrayAddressSpace(), expansion='in_place')
+    memory, root, levels = _pooled(machine, N, {'N': N})
+    machine.install_window(N, root, levels, memory=memory)
+    out = []
+    for part in _chunks(bits, seed):
+        out += machine.process_bits(part)[0]
+    return out, None
+
+
+def _window_kum_graph(segments, seed):
+    (N, bits), = segments
+    machine = KolmogorovUspenskyMachine(GraphAddressSpace())
+    machine.build_window(N)
+    out = []
+    for part in _chunks(bits, seed):
+        out += machine.process_bits(part)[0]
+    return out, None
+
+
+def _window_kum_steady(segments, seed):
+    (N, bits), = segments
+    machine = KolmogorovUspenskyMachine(ArrayAddressSpace(), expansion='in_place', seamless=True)
+    machine.build_window(N)
+    machine.compact_steady_state()
+    return _steps(machine, bits), None
+
+
+# --- Расширения на лету (kind='expansion') ---
+
+def _expanding(machine: KolmogorovUspenskyMachine, segments: Segments, seed: int,
+               batch: bool = False, install: Optional[Callable[[int], None]] = None):
+    out, windows = [], []
+    for i, (L, bits) in enumerate(segments):
+        (install or machine.build_tree_Gamma)(L)
+        parts = _chunks(bits, seed + i) if batch else [bytes((bit,)) for bit in bits]
+        for part in parts:
+            if batch:
+                out += machine.process_bits(part)[0]
+                windows += [machine.window_size] * len(part)
+            else:
+                out.append(machine.process_bit_step(part[0])[0])
+                windows.append(machine.window_size)
+    return out, windows
+
+
+def _expansion_rebuild(segments, seed):
+    machine = KolmogorovUspenskyMachine(GraphAddressSpace(), expansion='rebuild')
+    return _expanding(machine, segments, seed)[0], None
+
+
+def _expansion_in_place(segments, seed):
+    machine = KolmogorovUspenskyMachine(ArrayAddressSpace(), expansion='in_place')
+    return _expanding(machine, segments, seed, batch=True)[0], None
+
+
+def _expansion_seamless(segments, seed):
+    # Во время передачи курсора отвечает старое окно — сверяем с тем окном, что назвала машина
+    machine = KolmogorovUspenskyMachine(ArrayAddressSpace(), expansion='in_place', seamless=True)
+    return _expanding(machine, segments, seed)
+
+
+def _expansion_parallel(segments, seed):
+    # Каждый уровень строится в новой памяти пула; курсор переносится по канонической раскладке
+    machine = KolmogorovUspenskyMachine(ArrayAddressSpace(), expansion='in_place', seamless=True)
+    return _expanding(machine, segments, seed, install=lambda L: _install_pooled_tree(machine, L))
+
+
+def _expansion_background(segments, seed):
+    machine = KolmogorovUspenskyMachine(ArrayAddressSpace(), expansion='in_place', seamless=True)
+    builder = BackgroundBuilder(machine)
+
+    def install(L: int):
+        if not machine.trees:
+            machine.build_tree_Gamma(L)
+            return
+        builder.start(L)
+        builder.finish(start_next=False)
+
+    return _expanding(machine, segments, seed, install=install)
+
+
+ENGINES: Dict[str, Dict[str, Engine]] = {
+    'fixed': {
+        'kum': _fixed_kum,
+        'kum-parallel': _fixed_kum_parallel,
+        'kum-graph': _fixed_kum_graph,
+        'kum-seamless': _fixed_kum_seamless,
+        'kum-batch': _fixed_kum_batch,
+        'kum-packed': _fixed_kum_packed,
+        'kum-steady': _fixed_kum_steady,
+        'cursor': _fixed_cursor,
+        'implicit': _fixed_implicit,
+        'mt': _fixed_mt,
+        'xor': _fixed_xor,
+        'multi-xor': _fixed_multi_xor,
+    },
+    'window': {
+        'kum': _window_kum,
+        'kum-parallel': _window_kum_parallel,
+        'kum-graph': _window_kum_graph,
+        'kum-steady': _window_kum_steady,
+    },
+    'expansion': {
+        'kum-rebuild': _expansion_rebuild,
+        'kum-in-place': _expansion_in_place,
+        'kum-seamless': _expansion_seamless,
+        'kum-parallel': _expansion_parallel,
+        'kum-background': _expansion_background,
+    },
+}
+# Объектная память на больших L слишком медленна для быстрого прогона
+MAX_L = {'kum-graph': 3, 'kum-rebuild': 3}
+
+
+def check(case: Case, engine: str) -> Optional[Dict[str, Any]]:
+    """Прогнать движок на случае; None — совпало, иначе описание первого расхождения"""
+    segments = [(key, bytes(bits)) for key, bits in case['segments']]
+    try:
+        got, windows = ENGINES[case['kind']][engine](segments, case['seed'])
+    except Exception as e:
+        return {'index': None, 'error': f"{type(e).__name__}: {e}"}
+    bits = _stream(segments)
+    expected_windows = _segment_windows(case)
+    if windows is not None:
+        # Окно, названное машиной, обязано быть окном одного из уже построенных деревьев:
+        # после расширений подряд старый курсор ещё отвечает на более раннем окне
+        for t, (w, built) in enumerate(zip(windows, _built_windows(case))):
+            if w not in built:
+                return {'index': t, 'error': f"window {w} outside built {sorted(set(built))}"}
+    expected = reference(bits, windows if windows is not None else expected_windows)
+    if len(got) != len(expected):
+        return {'index': min(len(got), len(expected)), 'error': f"{len(got)} outputs for {len(expected)} bits"}
+    for t, (g, e) in enumerate(zip(got, expected)):
+        if g != e:
+            return {'index': t, 'expected': e, 'got': g}
+    return None
+
+
+def run_case(case: Case, engines: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """Все подходящие движки на одном случае; список расхождений"""
+    failures = []
+    top = max(key for key, _ in case['segments']) if case['kind'] != 'window' else 0
+    for engine in ENGINES[case['kind']]:
+        if engines is not None and engine not in engines:
+            continue
+        if top > MAX_L.get(engine, top):
+            continue
+        failure = check(case, engine)
+        if failure is not None:
+            failures.append({'case': case, 'engine': engine, **failure})
+    return failures
+
+
+def _run_batch(args) -> List[Dict[str, Any]]:
+    cases, engines = args
+    failures = []
+    for case in cases:
+        failures += run_case(case, engines)
+    return failures
+
+
+def _adversarial(N: int, length: int) -> List[bytes]:
+    """Потоки, на которых ошибаются на границах окна и при переносах"""
+    n = max(length, 2 * N + 3)
+    patterns = [
+        bytes(n),
+        bytes([1]) * n,
+        bytes(i & 1 for i in range(n)),
+        bytes(int(i % N == 0) for i in range(n)),
+        bytes(int(i % (N + 1) == 0) for i in range(n)),
+        bytes(int((i // N) & 1) for i in range(n)),
+        bytes([1]) + bytes(n - 1),
+    ]
+    # Длины вокруг заполнения окна
+    patterns += [bytes([1]) * k for k in (max(0, N - 1), N, N + 1)]
+    return patterns
+
+
+def generate_cases(levels: Sequence[int], seeds: int, length: int, seed: int = 0) -> List[Case]:
+    rng = random.Random(seed)
+    cases = [json.loads(json.dumps(case)) for case in REGRESSION_CASES]
+
+    def add(kind: str, segments):
+        cases.append({'kind': kind, 'seed': rng.randrange(2**31),
+                      'segments': [(key, list(bits)) for key, bits in segments]})
+
+    for L in levels:
+        N = 2**L
+        for bits in _adversarial(N, length):
+            add('fixed', [(L, bits)])
+        # На больших L построение дорого, поэтому случайных потоков меньше
+        for _ in range(seeds if L < TEMPLATE_FROM_L else max(1, seeds // 8)):
+            n = rng.randint(0, length)
+            bias = rng.choice((0.5, 0.1, 0.9))
+            add('fixed', [(L, bytes(int(rng.random() < bias) for _ in range(n)))])
+
+    for N in sorted({3, 5, 6, 7} | {2**L + 1 for L in levels if 2**L + 1 <= 12}):
+        for bits in _adversarial(N, length)[:4]:
+            add('window', [(N, bits)])
+        for _ in range(max(1, seeds // 4)):
+            add('window', [(N, bytes(rng.randint(0, 1) for _ in range(rng.randint(0, length))))])
+
+    def random_bits(n: int) -> bytes:
+        return bytes(rng.randint(0, 1) for _ in range(n))
+
+    top = max(levels)
+    for _ in range(seeds):
+        start = rng.randint(0, max(0, top - 1))
+        stop = rng.randint(start + 1, max(start + 1, top))
+        # Сегменты около 2N: успевают и короткие переходы, и полные окна; пустые
+        # и короче N — расширения подряд, пока прежнее окно ещё не заполнено
+        segments = [(L, random_bits(rng.choice((0, rng.randint(0, 2**L - 1),
+                                                rng.randint(0, 2 * 2**L + 3)))))
+                    for L in range(start, stop + 1)]
+        add('expansion', segments)
+
+    # Расширения подряд без входа между ними: от каждого уровня сразу до верхнего
+    for start in range(top):
+        segments = [(start, random_bits(2 * 2**start + 1))]
+        segments += [(L, b'') for L in range(start + 1, top)]
+        segments.append((top, random_bits(2**top + 2)))
+        add('expansion', segments)
+    return cases
+
+
+def shrink(failure: Dict[str, Any]) -> Case:
+    """
+    Ужать поток расхождения: выкидываем куски бит (от половин до одиночных),
+    затем обнуляем единицы, затем убираем последние сегменты — пока движок
+    продолжает расходиться с эталоном.
+    """
+    engine = failure['engine']
+    case = json.loads(json.dumps(failure['case']))
+
+    def fails(candidate: Case) -> bool:
+        return check(candidate, engine) is not None
+
+    changed = True
+    while changed:
+        changed = False
+        while case['kind'] == 'expansion' and len(case['segments']) > 1:
+            candidate = dict(case, segments=case['segments'][:-1])
+            if not fails(candidate):
+                break
+            case, changed = candidate, True
+        for s, (key, bits) in enumerate(case['segments']):
+            size = max(1, len(bits) // 2)
+            while size >= 1:
+                pos = 0
+                while pos < len(bits):
+                    trial = bits[:pos] + bits[pos + size:]
+                    candidate = dict(case, segments=case['segments'][:s] + [(key, trial)] + case['segments'][s + 1:])
+                    if fails(candidate):
+                        case, bits, changed = candidate, trial, True
+                    else:
+                        pos += size
+                size //= 2
+            for pos in range(len(bits)):
+                if bits[pos]:
+                    trial = bits[:pos] + [0] + bits[pos + 1:]
+                    candidate = dict(case, segments=case['segments'][:s] + [(key, trial)] + case['segments'][s + 1:])
+                    if fails(candidate):
+                        case, bits, changed = candidate, trial, True
+    return case
+
+
+def run(levels: Sequence[int], seeds: int = 20, length: int = 64, workers: Optional[int] = None,
+        engines: Optional[Sequence[str]] = None, seed: int = 0, do_shrink: bool = True) -> List[Dict[str, Any]]:
+    """Весь прогон: случаи по пулу процессов, затем ужатие расхождений"""
+    cases = generate_cases(levels, seeds, length, seed)
+    workers = workers or os.cpu_count() or 1
+    batches = [(cases[i::workers * 4], engines) for i in range(workers * 4)]
+    if workers == 1:
+        failures = [f for batch in batches for f in _run_batch(batch)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            failures = [f for result in pool.map(_run_batch, batches) for f in result]
+    if do_shrink:
+        for failure in failures:
+            failure['minimal'] = shrink(failure)
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Побитовая сверка KUM, МТ и эталона")
+    parser.add_argument('--levels', default='0-3', help="уровни L: '0-3' или '0,2,4'")
+    parser.add_argument('--seeds', type=int, default=20, help="случайных потоков на уровень")
+    parser.add_argument('--length', type=int, default=64, help="наибольшая длина случайного потока")
+    parser.add_argument('--workers', type=int, default=None, help="процессов в пуле (по умолчанию — все ядра)")
+    parser.add_argument('--engines', default=None, help="только эти движки, через запятую")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-shrink', action='store_true')
+    args = parser.parse_args(argv)
+
+    from benchmark import parse_levels
+    engines = args.engines.split(',') if args.engines else None
+    failures = run(parse_levels(args.levels), args.seeds, args.length, args.workers,
+                   engines, args.seed, not args.no_shrink)
+    if not failures:
+        print("Все движки совпадают с эталоном")
+        return 0
+    for failure in failures:
+        shown = failure.get('minimal', failure['case'])
+        print(json.dumps({'engine': failure['engine'], 'index': failure['index'],
+                          'error': failure.get('error'), 'minimal': shown}, ensure_ascii=False))
+    print(f"Расхождений: {len(failures)}", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
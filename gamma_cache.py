@@ -0,0 +1,187 @@
+"""
+Кэш построенных Γ(L) на диске.
+
+Файл — заголовок и три столбца int32 (ребёнок '0', ребёнок '1', ссылка 'S')
+плюс упакованные по биту метки, всё в каноническом кучевом размещении
+(корень — 0, уровень d — адреса 2^d - 1 .. 2^(d+1) - 2). Загрузка отображает
+файл через mmap и отдаёт столбцы как memoryview: узлы не десериализуются,
+а несколько процессов делят одну копию в страничном кэше ОС.
+"""
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from bisect import bisect_right
+from typing import List, Optional, Tuple
+
+from memory import ArrayAddressSpace, NIL
+
+FORMAT_VERSION = 1
+MAGIC = b'KUMGAMMA'
+# magic, версия, L, порядок байт (1 — little-endian), число узлов
+_HEADER = struct.Struct('<8sIIIQ')
+_HEADER_SIZE = 32  # с выравниванием столбцов на 4 байта
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'kum-gamma')
+
+# Временные файлы store, которые этот процесс пишет прямо сейчас
+_writing = set()
+_writing_lock = threading.Lock()
+
+
+def default_cache(directory: Optional[str] = None) -> Optional['GammaCache']:
+    """
+    Кэш включается явно: каталогом directory (например, из флага командной
+    строки) или переменной окружения KUM_GAMMA_CACHE. Без них кэша нет (None).
+    """
+    directory = directory or os.environ.get('KUM_GAMMA_CACHE')
+    return GammaCache(directory) if directory else None
+
+
+def temp_prefix() -> str:
+    """Префикс временных файлов store этого процесса"""
+    return f".gamma-{os.getpid()}-"
+
+
+def export_columns(memory, levels: List[range]) -> Tuple[array, array, array, bytearray]:
+    """Столбцы дерева с уровнями levels, перенумерованные в каноническое размещение"""
+    starts = [level.start for level in levels]
+    count = sum(len(level) for level in levels)
+
+    def canonical(addr: Optional[int]) -> int:
+        if addr is None:
+            return NIL
+        d = bisect_right(starts, addr) - 1
+        return 2**d - 1 + addr - starts[d]
+
+    child0, child1, suffix = array('i'), array('i'), array('i')
+    labels = bytearray((count + 7) // 8)
+    index = 0
+    for level in levels:
+        for addr in level:
+            child0.append(canonical(memory.follow(addr, '0')))
+            child1.append(canonical(memory.follow(addr, '1')))
+            suffix.append(canonical(memory.follow(addr, 'S')))
+            if memory.get_label(addr):
+                labels[index >> 3] |= 1 << (index & 7)
+            index += 1
+    return child0, child1, suffix, labels
+
+
+def can_replace_memory(machine) -> bool:
+    """Можно ли подменить память машины загруженной из кэша, не потеряв деревьев"""
+    return not machine.trees or (machine.expansion == 'in_place' and machine.is_canonical())
+
+
+class GammaCache:
+    """Каталог с файлами gamma-v<версия>-L<L>.bin"""
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY):
+        self.directory = directory
+
+    def remove_stale_temp_files(self) -> int:
+        """
+        Удалить временные файлы store с префиксом этого процесса, которые он
+        сейчас не пишет: их бросила прерванная запись (store идёт в фоновом
+        потоке-демоне и обрывается вместе с процессом; префикс совпадает, если
+        ОС выдала тот же pid). Чужие файлы не трогаются. Возвращает число удалённых.
+        """
+        prefix = temp_prefix()
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+        removed = 0
+        with _writing_lock:
+            for name in names:
+                path = os.path.join(self.directory, name)
+                if not (name.startswith(prefix) and name.endswith('.tmp')) or path in _writing:
+                    continue
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def path(self, L: int) -> str:
+        return os.path.join(self.directory, f"gamma-v{FORMAT_VERSION}-L{L}.bin")
+
+    def store(self, machine, L: int, levels: Optional[List[range]] = None) -> str:
+        """
+        Записать Γ(L) машины (атомарно: через временный файл и rename).
+        levels — уровни ещё не поставленного дерева, например из construct_tree.
+        """
+        levels = machine.levels[L] if levels is None else levels
+        child0, child1, suffix, labels = export_columns(machine.memory, levels)
+        os.makedirs(self.directory, exist_ok=True)
+        self.remove_stale_temp_files()
+        header = _HEADER.pack(MAGIC, FORMAT_VERSION, L, sys.byteorder == 'little', len(child0))
+        with _writing_lock:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=temp_prefix(), suffix='.tmp')
+            _writing.add(tmp_path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header.ljust(_HEADER_SIZE, b'\0'))
+                for column in (child0, child1, suffix):
+                    column.tofile(f)
+                f.write(labels)
+            os.replace(tmp_path, self.path(L))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            with _writing_lock:
+                _writing.discard(tmp_path)
+        return self.path(L)
+
+    def load(self, L: int) -> Optional[Tuple[ArrayAddressSpace, int, List[range]]]:
+        """
+        Отобразить Γ(L) из кэша в память. Возвращает (память, корень, уровни)
+        или None, если файла нет или он от другой версии формата/платформы.
+        """
+        try:
+            with open(self.path(L), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        view = memoryview(mapped)
+        magic, version, file_L, little, count = _HEADER.unpack_from(view)
+        expected_size = _HEADER_SIZE + 3 * 4 * count + (count + 7) // 8
+        if (magic != MAGIC or version != FORMAT_VERSION or file_L != L
+                or bool(little) != (sys.byteorder == 'little') or len(view) != expected_size):
+            return None
+
+        columns = []
+        offset = _HEADER_SIZE
+        for _ in range(3):
+            columns.append(view[offset:offset + 4 * count].cast('i'))
+            offset += 4 * count
+        labels = view[offset:offset + (count + 7) // 8]
+        memory = ArrayAddressSpace.from_columns(*columns, labels, count)
+        # mmap живёт, пока на него ссылаются memoryview столбцов
+        return memory, 0, [range(2**d - 1, 2**(d + 1) - 1) for d in range(2**L + 1)]
+
+    def load_or_build(self, machine, L: int):
+        """
+        Поставить в машину Γ(L) из кэша; при промахе построить и сохранить.
+        Подмена памяти возможна, только если в ней нет других деревьев
+        (пустая машина или каноническое дерево в режиме in_place).
+        """
+        loaded = self.load(L) if can_replace_memory(machine) else None
+        if loaded is not None:
+            memory, root, levels = loaded
+            machine.install_tree(L, root, levels, memory=memory)
+            return machine.trees[L]
+
+        root = machine.build_tree_Gamma(L)
+        try:
+            self.store(machine, L)
+        except OSError:
+            pass  # Кэш — только ускорение: без записи на диск машина работает так же
+        return root
@@ -0,0 +1,100 @@
+"""
+Инструментирование машины: таймеры фаз, счётчики выделений по фазам,
+гистограмма стоимости бита и трассировщик событий.
+
+Выключенное инструментирование почти ничего не стоит: построение
+проверяет один атрибут на уровень, а шаг по биту вообще не меняется —
+обёртка process_bit_step ставится на экземпляр только при включении.
+"""
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+BUILD_START = 'build-start'
+LEVEL_READY = 'level-ready'
+INIT_WALK = 'init-walk'
+# Окно найдено в новом дереве по шагу на бит (seamless): замена init-walk
+HANDOFF = 'handoff'
+STEADY_STEP = 'steady-step'
+ERROR = 'error'
+# Решение планировщика расширения (scheduler.ExpansionPlanner), только при его смене
+EXPANSION_DECISION = 'expansion-decision'
+EVENTS = (BUILD_START, LEVEL_READY, INIT_WALK, HANDOFF, STEADY_STEP, ERROR, EXPANSION_DECISION)
+
+Tracer = Callable[[str, Dict[str, Any]], None]
+
+
+class Instrumentation:
+    """
+    Счётчики одной машины. tracer(event, data) получает события из EVENTS;
+    steady-step — только с trace_steps=True, их по одному на каждый бит.
+    Построение в фоновом потоке (scheduler.py) вызывает tracer из этого потока.
+    """
+
+    def __init__(self, tracer: Optional[Tracer] = None, trace_steps: bool = False):
+        self.tracer = tracer
+        self.trace_steps = trace_steps
+        self.phase_time: Dict[str, float] = defaultdict(float)
+        self.phase_calls: Counter = Counter()
+        self.phase_allocations: Counter = Counter()
+        self.cost_histogram: Counter = Counter()
+        # Завершённые передачи курсора: окно, операции поиска, за сколько бит
+        self.handoffs: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def phase(self, name: str, memory=None):
+        """Замерить фазу: время и (если дана память) число выделенных ячеек"""
+        before = len(memory) if memory is not None else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_time[name] += time.perf_counter() - start
+            self.phase_calls[name] += 1
+            if memory is not None:
+                self.phase_allocations[name] += len(memory) - before
+
+    def emit(self, event: str, **data):
+        if self.tracer is not None:
+            self.tracer(event, data)
+
+    def record_cost(self, cost: int, count: int = 1):
+        self.cost_histogram[cost] += count
+
+    def observe_step(self, bit: int, result):
+        """Учесть шаг process_bit_step по его (результату, сообщению, стоимости)"""
+        res, msg, cost = result
+        self.cost_histogram[cost] += 1
+        if self.tracer is None:
+            return
+        if msg.startswith("Init"):
+            self.tracer(INIT_WALK, {'bit': bit, 'result': res, 'cost': cost})
+        elif msg.startswith("Error"):
+            self.tracer(ERROR, {'bit': bit, 'message': msg, 'cost': cost})
+        elif self.trace_steps and msg.startswith("Real-Time"):
+            self.tracer(STEADY_STEP, {'bit': bit, 'result': res, 'cost': cost})
+
+    def observe_handoff(self, N: int, cost: int, bits: int, initial: bool):
+        """Учесть завершённый поиск окна в новом дереве (initial — первого окна машины)"""
+        handoff = {'N': N, 'cost': cost, 'bits': bits, 'initial': initial}
+        self.handoffs.append(handoff)
+        if self.tracer is not None:
+            self.tracer(HANDOFF, handoff)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'phases': {name: {'seconds': self.phase_time[name],
+                              'calls': self.phase_calls[name],
+                              'allocations': self.phase_allocations[name]}
+                       for name in self.phase_time},
+            'cost_histogram': dict(sorted(self.cost_histogram.items())),
+            'handoffs': list(self.handoffs),
+        }
+
+    def reset(self):
+        self.phase_time.clear()
+        self.phase_calls.clear()
+        self.phase_allocations.clear()
+        self.cost_histogram.clear()
+        self.handoffs.clear()
@@ -1,12 +1,30 @@
-import time
+import json
 import sys
+import time
+from typing import Optional
 from KUM import KolmogorovUspenskyMachine
+from memory import ArrayAddressSpace
+from scheduler import BackgroundBuilder, ExpansionPlanner
+from gamma_cache import default_cache, DEFAULT_DIRECTORY
+from render import Renderer
 
 class KUMInteractiveInterface:
-    def __init__(self):
-        self.machine = KolmogorovUspenskyMachine()
+    def __init__(self, render_mode: str = 'full', refresh_hz: float = 20.0,
+                 cache_directory: Optional[str] = None):
+        # Дерево растёт на месте: расширение стоит только новых узлов,
+        # а в памяти всегда лежит одно дерево.
+        self.machine = KolmogorovUspenskyMachine(ArrayAddressSpace(), expansion='in_place', seamless=True)
         self.inputs_since_build = 0
-        self.base_cycle_multiplier = 2.0 
+        # Уже построенные уровни берутся с диска, если кэш включён
+        # флагом --cache[=каталог] или переменной KUM_GAMMA_CACHE
+        self.cache = default_cache(cache_directory)
+        # Расширение — когда средняя стоимость построения на бит не выше порога;
+        # Γ(5) (2^33 узлов) в бюджет памяти не помещается, и планировщик его не пустит
+        self.memory_budget = 1 << 30
+        self.planner = ExpansionPlanner(self.machine, memory_budget=self.memory_budget, cache=self.cache)
+        self.builder = BackgroundBuilder(self.machine, cache=self.cache, planner=self.planner)
+        # Вставленные длинные строки бит печатаются с прореживанием кадров
+        self.renderer = Renderer(render_mode, refresh_hz)
 
     def print_header(self):
         print("\n" + "="*65)
@@ -16,13 +34,18 @@ class KUMInteractiveInterface:
         print("Инструкция:")
         print("  0, 1 : Добавить бит")
         print("  !    : Принудительно расширить память (L -> L+1)")
+        print("  ?    : Текущее решение планировщика расширения")
         print("  #    : Выход")
         print("-" * 65)
 
     def print_state(self, bit, res, msg, cost):
-        L = self.machine.current_L
-        N = 2**L
-        
+        # Во время передачи курсора на новый уровень ответ ещё даёт старое окно
+        N = self.machine.window_size
+        # Строка кадра собирается, только если кадр будет напечатан
+        self.renderer.frame(lambda: self.format_state(bit, res, msg, N),
+                            bits=self.machine.input_buffer.total, N=N, xor=res)
+
+    def format_state(self, bit, res, msg, N) -> str:
         full_buffer = self.machine.input_buffer
 
         if len(full_buffer) < N:
@@ -43,13 +66,20 @@ class KUMInteractiveInterface:
             xor_display = f"{res_color}{res}\033[0m"
             status_color = "\033[93m"
             status_text = msg
-        print(f" In: {bit} | Win(N={N}): \033[1m[{window_str}]\033[0m -> XOR: {xor_display:<5} | {status_color}{status_text}\033[0m")
+        return f" In: {bit} | Win(N={N}): \033[1m[{window_str}]\033[0m -> XOR: {xor_display:<5} | {status_color}{status_text}\033[0m"
 
     def run(self):
         self.print_header()
 
         print("Инициализация L=0...")
-        self.machine.build_tree_Gamma(0)
+        memory, start = self.machine.memory, time.perf_counter()
+        if self.cache is not None:
+            self.cache.load_or_build(self.machine, 0)
+        else:
+            self.machine.build_tree_Gamma(0)
+        source = 'build' if self.machine.memory is memory else 'cache'
+        self.planner.record_build(0, len(self.machine.memory), time.perf_counter() - start, source)
+        self.builder.start()
         
         while True:
             try:
@@ -65,42 +95,78 @@ class KUMInteractiveInterface:
             if user_input == '!':
                 self.expand_memory()
                 continue
+            if user_input == '?':
+                print(json.dumps(self.planner.decide(self.inputs_since_build), ensure_ascii=False, indent=2))
+                continue
 
             for char in user_input:
                 if char not in ['0', '1']:
-                    print(f" Пропущен символ: {char}")
+                    self.renderer.message(f" Пропущен символ: {char}")
                     continue
 
                 bit = int(char)
                 
+                if self.builder.poll():
+                    self.report_swap()
                 res, msg, cost = self.machine.process_bit_step(bit)
                 self.inputs_since_build += 1
                 
                 self.print_state(bit, res, msg, cost)
                 
-                current_N = 2**self.machine.current_L
-                cycle_limit = int(current_N * self.base_cycle_multiplier) + 4
-                
-                if self.inputs_since_build >= cycle_limit:
-                    print(f"\n\033[90m[Лимит цикла {cycle_limit} достигнут. Расширение...]\033[0m")
-                    time.sleep(0.5)
+                if self.builder.swap_requested:
+                    continue
+                decision = self.planner.decide(self.inputs_since_build)
+                if decision['action'] == 'expand':
+                    self.renderer.message(f"\n\033[90m[Стоимость построения {decision['amortized_cost']:.1f} узл./бит "
+                                          f"≤ {decision['target_cost']:g}. Расширение...]\033[0m")
                     self.expand_memory()
-                    break 
+                elif decision['action'] == 'refuse' and decision['changed']:
+                    self.report_refusal(decision)
+            self.renderer.flush()
 
     def expand_memory(self):
-        """Переход к следующему уровню L"""
-        next_L = self.machine.current_L + 1
-        print(f"\n--- Перестройка Графа Памяти: L={next_L} (Окно N={2**next_L}) ---")
-        
-        start = time.time()
-        self.machine.build_tree_Gamma(next_L)
-        dt = time.time() - start
-        
-        print(f"Построено за {dt:.4f} сек. Узлов: {self.machine.stats['nodes_created']}")
+        """
+        Переход к следующему уровню L. Дерево уже строится в фоне:
+        если оно готово, подменяем сразу, иначе ввод продолжается,
+        а подмена случится на первом бите после окончания построения.
+        """
+        if self.builder.target_L is None and not self.builder.start():
+            self.report_refusal(self.planner.last)
+            self.inputs_since_build = 0
+            return
+        if self.builder.request_swap():
+            self.report_swap()
+            return
+
+        status = self.builder.status()
+        eta = status['eta']
+        eta_str = f"{eta:.2f} сек" if eta is not None else "?"
+        self.renderer.message(f"\n\033[90m[Γ(L={status['target_L']}) строится в фоне: "
+                              f"{status['progress']:.0%}, осталось ≈ {eta_str}]\033[0m")
+
+    def report_refusal(self, decision):
+        if decision is not None and decision['reason'] == 'over-budget':
+            self.renderer.message(f"\n\033[90m[Γ(L={decision['L']}) не помещается в бюджет памяти: "
+                                  f"≈ {decision['peak_bytes'] / 2**20:.0f} МиБ из {decision['budget'] / 2**20:.0f} МиБ]\033[0m")
+        else:
+            self.renderer.message(f"\n\033[90m[Достигнут максимальный уровень L={self.machine.current_L}]\033[0m")
 
+    def report_swap(self):
+        L = self.machine.current_L
+        self.renderer.message(f"\n--- Перестройка Графа Памяти: L={L} (Окно N={2**L}) ---\n"
+                              f"Узлов: {len(self.machine.memory)}")
         self.inputs_since_build = 0
 
 
 if __name__ == "__main__":
-    app = KUMInteractiveInterface()
+    # --summary: только сводная строка, машина работает на полной скорости
+    # --cache[=каталог]: кэш Γ(L) на диске (по умолчанию ~/.cache/kum-gamma)
+    cache_directory = None
+    for arg in sys.argv[1:]:
+        if arg == '--cache':
+            cache_directory = DEFAULT_DIRECTORY
+        elif arg.startswith('--cache='):
+            cache_directory = arg[len('--cache='):]
+    app = KUMInteractiveInterface('summary' if '--summary' in sys.argv else 'full',
+                                  cache_directory=cache_directory)
     app.run()
\ No newline at end of file
@@ -1,14 +1,33 @@
+from array import array
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, Optional, Set
+
+from access_cost import AccessCostAnalyzer
+from active_zone import ActiveZone
+
+
+NIL = -1
+
+
 class MemoryCell:
     """Ячейка памяти в графовой архитектуре"""
-    def __init__(self, address):
+    def __init__(self, address, space=None):
         self.address = address
         self.content = None      
         self.pointers = {}       
         self.tags = set()        
+        # Пространство, которому принадлежит ячейка: через него идут изменения ссылок
+        self.space = space
         
     def add_pointer(self, label, target_cell):
-        """Добавить ссылку с меткой label на другую ячейку"""
-        self.pointers[label] = target_cell
+        """
+        Добавить ссылку с меткой label на другую ячейку. Ячейка пространства
+        меняется через него, чтобы сдвинулась версия (кэш расстояний) и зоны.
+        """
+        if self.space is not None:
+            self.space.add_pointer(self.address, label, target_cell.address)
+        else:
+            self.pointers[label] = target_cell
         
     def follow(self, label):
         """Перейти по ссылке с меткой label"""
@@ -32,27 +51,73 @@ class GraphAddressSpace:
         self.next_address = 0
         self.active_cells = set() 
         self.access_cost = 1      
+        # Растёт с каждой новой ссылкой: по нему сбрасываются кэши расстояний
+        self.version = 0
+        self._access_costs: Optional[AccessCostAnalyzer] = None
+        # Зоны, поддерживаемые на ходу (track_active_zone), по радиусу
+        self.zones: Dict[int, ActiveZone] = {}
         
     def allocate(self, content=None):
         """Выделить новую ячейку памяти"""
         addr = self.next_address
-        cell = MemoryCell(addr)
+        cell = MemoryCell(addr, self)
         cell.content = content
         self.cells[addr] = cell
         self.next_address += 1
         return cell
     
+    def allocate_block(self, labels, payloads=None) -> range:
+        """
+        Выделить подряд len(labels) ячеек с метками labels.
+        payloads — необязательное дополнительное содержимое для каждой ячейки.
+        Возвращает диапазон адресов.
+        """
+        start = self.next_address
+        for i, label in enumerate(labels):
+            content = {'label': label}
+            if payloads is not None and payloads[i]:
+                content.update(payloads[i])
+            self.allocate(content=content)
+        return range(start, self.next_address)
+
     def get_cell(self, address):
         """Получить ячейку по адресу"""
         return self.cells.get(address)
+
+    def get_content(self, address):
+        """Содержимое ячейки по адресу"""
+        cell = self.get_cell(address)
+        return cell.content if cell else None
+
+    def set_content(self, address, content):
+        """Заменить содержимое ячейки"""
+        cell = self.get_cell(address)
+        if cell:
+            cell.content = content
+
+    def get_label(self, address) -> int:
+        """Бит-метка узла (content['label']), 0 если её нет"""
+        content = self.get_content(address)
+        if isinstance(content, dict):
+            return content.get('label', 0)
+        return 0
     
     def add_pointer(self, from_addr, label, to_addr):
         """Создать ссылку между ячейками"""
         from_cell = self.get_cell(from_addr)
         to_cell = self.get_cell(to_addr)
         if from_cell and to_cell:
-            from_cell.add_pointer(label, to_cell)
+            replaced = from_cell.pointers.get(label)
+            from_cell.pointers[label] = to_cell
+            self.version += 1
+            for zone in self.zones.values():
+                zone.pointer_added(from_addr, to_addr, replaced.address if replaced is not None else None)
             
+    def add_pointers(self, sources, label, targets):
+        """Массово создать ссылки sources[i] --label--> targets[i]"""
+        for from_addr, to_addr in zip(sources, targets):
+            self.add_pointer(from_addr, label, to_addr)
+
     def follow_pointer(self, from_addr, label):
         """Перейти по ссылке из ячейки"""
         cell = self.get_cell(from_addr)
@@ -60,20 +125,73 @@ class GraphAddressSpace:
             target = cell.pointers[label]
             return target.address, target.content
         return None, None
+
+    def follow(self, from_addr, label) -> Optional[int]:
+        """Перейти по ссылке, вернуть только адрес (None, если ссылки нет)"""
+        cell = self.get_cell(from_addr)
+        if cell:
+            target = cell.pointers.get(label)
+            if target is not None:
+                return target.address
+        return None
+
+    def pointers(self, address) -> Dict[Any, int]:
+        """Все ссылки ячейки в виде {метка: адрес}"""
+        cell = self.get_cell(address)
+        if not cell:
+            return {}
+        return {label: target.address for label, target in cell.pointers.items()}
+
+    def __len__(self):
+        return len(self.cells)
     
     def set_active(self, address):
         """Добавить ячейку в активную зону"""
         cell = self.get_cell(address)
         if cell:
             self.active_cells.add(cell)
-            
+            for zone in self.zones.values():
+                zone.activate(address)
+
+    def set_inactive(self, address):
+        """Убрать ячейку из активных"""
+        cell = self.get_cell(address)
+        if cell:
+            self.active_cells.discard(cell)
+            for zone in self.zones.values():
+                zone.deactivate(address)
+
+    def track_active_zone(self, radius=3) -> ActiveZone:
+        """
+        Поддерживать зону радиуса radius на ходу: дальше set_active,
+        set_inactive и add_pointer обновляют её, а размер и принадлежность
+        отвечаются за O(1) (active_zone_size, in_active_zone).
+        Зоны разных радиусов поддерживаются одновременно, каждая своя.
+        """
+        zone = self.zones.get(radius)
+        if zone is None:
+            zone = self.zones[radius] = ActiveZone(self, radius)
+            for cell in self.active_cells:
+                zone.activate(cell.address)
+        return zone
+
+    def active_zone_size(self, max_distance=3) -> int:
+        return len(self.track_active_zone(max_distance))
+
+    def in_active_zone(self, address, max_distance=3) -> bool:
+        return address in self.track_active_zone(max_distance)
+
     def get_active_zone(self, max_distance=3):
         """
         Получить активную зону: все ячейки, достижимые из 
         текущих активных за max_distance переходов.
+        Если зона того же радиуса поддерживается на ходу, она не пересчитывается.
         """
         if not self.active_cells:
             return set()
+        zone = self.zones.get(max_distance)
+        if zone is not None:
+            return {self.get_cell(address) for address in zone}
             
         zone = set(self.active_cells)
         frontier = list(self.active_cells)
@@ -91,45 +209,402 @@ class GraphAddressSpace:
                 
         return zone
     
+    def addresses(self) -> Iterator[int]:
+        """Адреса занятых ячеек по возрастанию"""
+        return iter(sorted(self.cells))
+
+    def free(self, address) -> bool:
+        """
+        Освободить ячейку. Ссылки на неё из других ячеек не снимаются,
+        поэтому освобождать можно только то, до чего уже не дойти (см. collect).
+        """
+        cell = self.cells.pop(address, None)
+        if cell is None:
+            return False
+        self.active_cells.discard(cell)
+        for zone in self.zones.values():
+            zone.deactivate(address)
+        self.version += 1
+        return True
+
+    def _edges(self, address) -> Iterable[int]:
+        return self.pointers(address).values()
+
+    def mark(self, roots: Iterable[int]) -> Set[int]:
+        """Адреса, достижимые из roots по любым ссылкам"""
+        live = set()
+        queue = deque()
+        for root in roots:
+            if root is not None and root not in live and self.get_cell(root) is not None:
+                live.add(root)
+                queue.append(root)
+        edges = self._edges
+        while queue:
+            for target in edges(queue.popleft()):
+                if target not in live:
+                    live.add(target)
+                    queue.append(target)
+        return live
+
+    def collect(self, roots: Iterable[int] = ()) -> int:
+        """
+        Сборка мусора пометкой и очисткой: освободить всё, что недостижимо
+        из roots и активных ячеек. Возвращает число освобождённых ячеек.
+        """
+        live = self.mark(list(roots) + [cell.address for cell in self.active_cells])
+        dead = [address for address in self.addresses() if address not in live]
+        for address in dead:
+            self.free(address)
+        return len(dead)
+
+    def compact(self) -> Dict[int, int]:
+        """
+        Перенумеровать ячейки подряд с нуля, сохраняя их порядок.
+        Возвращает {старый адрес: новый} — по нему владельцы адресов
+        (деревья, курсоры) переводят свои ссылки.
+        """
+        remap = {old: new for new, old in enumerate(sorted(self.cells))}
+        cells = {}
+        for old, new in remap.items():
+            cell = self.cells[old]
+            cell.address = new
+            cells[new] = cell
+        self.cells = cells
+        self.next_address = len(cells)
+        self._renumbered(remap)
+        return remap
+
+    def _renumbered(self, remap: Dict[int, int]):
+        """Адреса сменились: кэш расстояний сбрасывается по версии, зоны пересчитываются"""
+        self.version += 1
+        for zone in self.zones.values():
+            zone.remap(remap)
+
+    def access_costs(self) -> AccessCostAnalyzer:
+        """Анализатор стоимостей доступа этой памяти (один на пространство, с кэшем)"""
+        if self._access_costs is None:
+            self._access_costs = AccessCostAnalyzer(self)
+        return self._access_costs
+
     def simulate_access_cost(self, from_addr, to_addr):
         """
         В идеализированной модели Колмогорова доступ всегда стоит 1,
         независимо от "расстояния" в графе.
-        Но мы можем эмулировать разные стратегии.
+        Здесь эмулируется неидеальная память: по прямой ссылке — access_cost,
+        иначе кратчайшее число переходов + 1 (см. access_cost.py).
         """
-        
-        
-        
-        from_cell = self.get_cell(from_addr)
-        to_cell = self.get_cell(to_addr)
-        
-        if not from_cell or not to_cell:
-            return float('inf')
-            
-        
-        for label, target in from_cell.pointers.items():
-            if target.address == to_addr:
-                return self.access_cost  
-                
-        
-        
-        visited = set()
-        queue = [(from_cell, 0)]
-        
-        while queue:
-            cell, distance = queue.pop(0)
-            if cell.address == to_addr:
-                return distance + 1  
-                
-            visited.add(cell.address)
-            for neighbor in cell.pointers.values():
-                if neighbor.address not in visited:
-                    queue.append((neighbor, distance + 1))
-                    
-        return float('inf')  
-    
+        return self.access_costs().cost(from_addr, to_addr)
+
+    def __repr__(self):
+        return f"GraphAddressSpace(cells={len(self)}, active={len(self.active_cells)})"
+
+
+class ArrayCell:
+    """
+    Лёгкое представление ячейки ArrayAddressSpace.
+    Ничего не хранит, кроме адреса: все поля читаются из столбцов пространства.
+    """
+    __slots__ = ('space', 'address')
+
+    def __init__(self, space, address):
+        self.space = space
+        self.address = address
+
+    @property
+    def content(self):
+        return self.space.get_content(self.address)
+
+    @content.setter
+    def content(self, value):
+        self.space.set_content(self.address, value)
+
+    @property
+    def pointers(self):
+        return {label: ArrayCell(self.space, addr)
+                for label, addr in self.space.pointers(self.address).items()}
+
+    def add_pointer(self, label, target_cell):
+        self.space.add_pointer(self.address, label, target_cell.address)
+
+    def follow(self, label):
+        addr = self.space.follow(self.address, label)
+        return ArrayCell(self.space, addr) if addr is not None else None
+
+    def __eq__(self, other):
+        return (isinstance(other, ArrayCell) and other.space is self.space
+                and other.address == self.address)
+
+    def __hash__(self):
+        return hash(self.address)
+
+    def __repr__(self):
+        ptrs = list(self.space.pointers(self.address).keys())
+        return f"Cell({self.address}, content={self.content}, ptrs={ptrs})"
+
+
+class ArrayAddressSpace(GraphAddressSpace):
+    """
+    Компактное адресное пространство "структура массивов".
+    Ссылки '0', '1' и 'S' лежат в плоских столбцах целых чисел (NIL = нет ссылки),
+    метки узлов упакованы по одному биту. Остальное содержимое ячеек и прочие
+    метки ссылок хранятся в разреженных словарях и для Γ(L) обычно пусты.
+    """
+
+    COLUMNS = {'0': 0, '1': 1, 'S': 2}
+
+    def __init__(self):
+        super().__init__()
+        self.child0 = array('i')
+        self.child1 = array('i')
+        self.suffix = array('i')
+        self.children = (self.child0, self.child1)
+        self.labels = bytearray()
+        self.payload: Dict[int, Any] = {}
+        self.extra_pointers: Dict[int, Dict[Any, int]] = {}
+        # Освобождённые адреса: дыры в столбцах до следующего compact
+        self.freed: Set[int] = set()
+        self._columns = (self.child0, self.child1, self.suffix)
+
+    @classmethod
+    def from_columns(cls, child0, child1, suffix, labels, count: int) -> 'ArrayAddressSpace':
+        """
+        Пространство поверх готовых столбцов, например memoryview над mmap-файлом.
+        Столбцы не копируются; копия в собственные массивы делается только
+        при первой записи.
+        """
+        space = cls()
+        space.child0, space.child1, space.suffix = child0, child1, suffix
+        space.children = (child0, child1)
+        space._columns = (child0, child1, suffix)
+        space.labels = labels
+        space.next_address = count
+        return space
+
+    def _ensure_writable(self):
+        """Копирование при записи для столбцов, заданных чужими буферами"""
+        if isinstance(self.child0, array):
+            return
+        self.child0, self.child1, self.suffix = (array('i', col) for col in self._columns)
+        self.children = (self.child0, self.child1)
+        self._columns = (self.child0, self.child1, self.suffix)
+        self.labels = bytearray(self.labels)
+
+    def allocate(self, content=None):
+        """Выделить новую ячейку памяти"""
+        self._ensure_writable()
+        addr = self.next_address
+        self.child0.append(NIL)
+        self.child1.append(NIL)
+        self.suffix.append(NIL)
+        if addr & 7 == 0:
+            self.labels.append(0)
+        self.next_address += 1
+        self.set_content(addr, content)
+        return ArrayCell(self, addr)
+
+    def allocate_block(self, labels, payloads=None) -> range:
+        """
+        Выделить подряд len(labels) ячеек: столбцы растут одним extend,
+        метки упаковываются сразу в битовый столбец.
+        """
+        self._ensure_writable()
+        start = self.next_address
+        count = len(labels)
+        empty = array('i', [NIL]) * count
+        self.child0.extend(empty)
+        self.child1.extend(empty)
+        self.suffix.extend(empty)
+        self.next_address += count
+        self.labels.extend(bytes((self.next_address + 7) // 8 - len(self.labels)))
+        for addr, label in zip(range(start, self.next_address), labels):
+            if label & 1:
+                self.labels[addr >> 3] |= 1 << (addr & 7)
+        if payloads is not None:
+            for addr, extra in zip(range(start, self.next_address), payloads):
+                if extra:
+                    self.payload[addr] = dict(extra)
+        return range(start, self.next_address)
+
+    def _valid(self, address):
+        return (isinstance(address, int) and 0 <= address < self.next_address
+                and (not self.freed or address not in self.freed))
+
+    def get_cell(self, address):
+        """Получить ячейку по адресу"""
+        return ArrayCell(self, address) if self._valid(address) else None
+
+    def get_label(self, address) -> int:
+        """Бит-метка узла"""
+        return (self.labels[address >> 3] >> (address & 7)) & 1
+
+    def _set_label(self, address, bit):
+        self._ensure_writable()
+        if bit:
+            self.labels[address >> 3] |= 1 << (address & 7)
+        else:
+            self.labels[address >> 3] &= ~(1 << (address & 7)) & 0xFF
+
+    def get_content(self, address):
+        """Содержимое ячейки: метка из битового столбца плюс разреженная часть"""
+        if not self._valid(address):
+            return None
+        extra = self.payload.get(address)
+        if extra is not None and not isinstance(extra, dict):
+            return extra
+        content = {'label': self.get_label(address)}
+        if extra:
+            content.update(extra)
+        return content
+
+    def set_content(self, address, content):
+        """Записать содержимое: 'label' уходит в битовый столбец, остальное в payload"""
+        if not self._valid(address):
+            return
+        self.payload.pop(address, None)
+        if isinstance(content, dict):
+            self._set_label(address, content.get('label', 0) & 1)
+            rest = {k: v for k, v in content.items() if k != 'label'}
+            if rest:
+                self.payload[address] = rest
+        else:
+            self._set_label(address, 0)
+            if content is not None:
+                self.payload[address] = content
+
+    def add_pointer(self, from_addr, label, to_addr):
+        """Создать ссылку между ячейками"""
+        if not (self._valid(from_addr) and self._valid(to_addr)):
+            return
+        self._ensure_writable()
+        column = self.COLUMNS.get(label)
+        replaced = self.follow(from_addr, label) if self.zones else None
+        if column is not None:
+            self._columns[column][from_addr] = to_addr
+        else:
+            self.extra_pointers.setdefault(from_addr, {})[label] = to_addr
+        self.version += 1
+        for zone in self.zones.values():
+            zone.pointer_added(from_addr, to_addr, replaced)
+
+    def add_pointers(self, sources, label, targets):
+        """Массово создать ссылки; непрерывный диапазон источников пишется срезом"""
+        self._ensure_writable()
+        column = self.COLUMNS.get(label)
+        # Поддерживаемым зонам нужна каждая ссылка по отдельности
+        if (column is not None and not self.zones and isinstance(sources, range) and sources.step == 1
+                and len(sources) and self._valid(sources[0]) and self._valid(sources[-1])):
+            values = array('i', targets)
+            if len(values) == len(sources):
+                self._columns[column][sources.start:sources.stop] = values
+                self.version += 1
+                return
+        super().add_pointers(sources, label, targets)
+
+    def follow(self, from_addr, label) -> Optional[int]:
+        """Перейти по ссылке, вернуть только адрес (None, если ссылки нет)"""
+        if not self._valid(from_addr):
+            return None
+        column = self.COLUMNS.get(label)
+        if column is not None:
+            target = self._columns[column][from_addr]
+            return target if target != NIL else None
+        return self.extra_pointers.get(from_addr, {}).get(label)
+
+    def follow_pointer(self, from_addr, label):
+        """Перейти по ссылке из ячейки"""
+        target = self.follow(from_addr, label)
+        if target is None:
+            return None, None
+        return target, self.get_content(target)
+
+    def pointers(self, address) -> Dict[Any, int]:
+        """Все ссылки ячейки в виде {метка: адрес}"""
+        if not self._valid(address):
+            return {}
+        result = {}
+        for label, column in self.COLUMNS.items():
+            target = self._columns[column][address]
+            if target != NIL:
+                result[label] = target
+        result.update(self.extra_pointers.get(address, {}))
+        return result
+
+    def addresses(self) -> Iterator[int]:
+        """Адреса занятых ячеек по возрастанию"""
+        freed = self.freed
+        return (address for address in range(self.next_address) if address not in freed)
+
+    def free(self, address) -> bool:
+        """
+        Освободить ячейку: её ссылки, метка и содержимое стираются, адрес
+        становится дырой до compact. Ссылки на неё из других ячеек не снимаются.
+        """
+        if not self._valid(address):
+            return False
+        self._ensure_writable()
+        for column in self._columns:
+            column[address] = NIL
+        self.labels[address >> 3] &= ~(1 << (address & 7)) & 0xFF
+        self.payload.pop(address, None)
+        self.extra_pointers.pop(address, None)
+        self.active_cells.discard(ArrayCell(self, address))
+        for zone in self.zones.values():
+            zone.deactivate(address)
+        self.freed.add(address)
+        self.version += 1
+        return True
+
+    def _edges(self, address) -> Iterable[int]:
+        found = [target for target in (self.child0[address], self.child1[address], self.suffix[address])
+                 if target != NIL]
+        extra = self.extra_pointers.get(address)
+        if extra:
+            found.extend(extra.values())
+        return found
+
+    def compact(self) -> Dict[int, int]:
+        """
+        Убрать дыры: живые ячейки сдвигаются к началу в прежнем порядке,
+        столбцы и метки пересобираются. Возвращает {старый адрес: новый}.
+        """
+        if not self.freed:
+            return {address: address for address in range(self.next_address)}
+        live = list(self.addresses())
+        remap = {old: new for new, old in enumerate(live)}
+        index = array('i', [NIL]) * self.next_address
+        for old, new in remap.items():
+            index[old] = new
+        columns = []
+        for column in self._columns:
+            columns.append(array('i', (NIL if column[old] == NIL else index[column[old]] for old in live)))
+        labels = bytearray((len(live) + 7) // 8)
+        for new, old in enumerate(live):
+            if self.get_label(old):
+                labels[new >> 3] |= 1 << (new & 7)
+
+        self.child0, self.child1, self.suffix = columns
+        self.children = (self.child0, self.child1)
+        self._columns = (self.child0, self.child1, self.suffix)
+        self.labels = labels
+        self.payload = {remap[a]: value for a, value in self.payload.items()}
+        self.extra_pointers = {remap[a]: {label: remap[t] for label, t in ptrs.items() if t in remap}
+                               for a, ptrs in self.extra_pointers.items()}
+        self.active_cells = {ArrayCell(self, remap[cell.address]) for cell in self.active_cells}
+        self.freed = set()
+        self.next_address = len(live)
+        self._renumbered(remap)
+        return remap
+
+    def nbytes(self) -> int:
+        """Объём столбцов в байтах (без разреженных словарей)"""
+        columns = sum(col.itemsize * len(col) for col in self._columns)
+        return columns + len(self.labels)
+
+    def __len__(self):
+        return self.next_address - len(self.freed)
+
     def __repr__(self):
-        return f"GraphAddressSpace(cells={len(self.cells)}, active={len(self.active_cells)})"
+        return f"ArrayAddressSpace(cells={len(self)}, active={len(self.active_cells)})"
 
 
 
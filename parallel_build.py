@@ -0,0 +1,237 @@
+"""
+Параллельное построение бора чётности на пуле процессов.
+
+Копии Γ(L-1) под разными листьями отличаются только маской XOR, а ссылки
+'S' внутри непересекающихся поддеревьев друг от друга не зависят. В
+каноническом (кучевом) размещении это видно прямо по адресам: у узла a
+дети 2a+1 и 2a+2, узел с номером i на уровне d ссылается по 'S' на узел
+с номером i без старшего бита на уровне d-1, а метка — чётность номера.
+Поэтому каждый процесс заполняет свой диапазон адресов независимо, без
+обмена узлами.
+
+Столбцы (как в файле кэша: ребёнок '0', ребёнок '1', 'S', упакованные метки)
+лежат в multiprocessing.shared_memory; процессы получают только имя блока
+и границы диапазона, графы объектов не сериализуются.
+
+Пул один на процесс и число процессов в нём (запуск forkserver стоит ~0.25 с,
+поэтому его платят один раз). Пул берётся, только если по замеренной стоимости
+узла _fill и числу доступных ядер он быстрее заполнения в своём процессе.
+"""
+import multiprocessing
+import multiprocessing.util
+import os
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+from memory import ArrayAddressSpace, NIL
+
+# Накладные расходы одного построения на запущенном пуле: блок shared_memory и
+# рассылка задач (замер: ~6 мс на 8 задач). Заполнение на k ядрах окупает их,
+# когда узлов столько, что count * стоимость узла * (1 - 1/k) больше этого;
+# _fill стоит ~0.25 мкс на узел, так что Γ(4) (2^17 узлов) идёт в пул уже на двух ядрах
+POOL_DISPATCH_SECONDS = 0.006
+# Узлов в калибровочном заполнении для замера стоимости узла
+_CALIBRATION_NODES = 2**14 - 1
+# Задач на процесс: мелкие задачи выравнивают нагрузку между уровнями
+TASKS_PER_WORKER = 4
+# Пул запускается и из фонового потока (scheduler.py), а fork многопоточного процесса небезопасен
+_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def _parity(x: int) -> int:
+    return bin(x).count('1') & 1
+
+
+# Байт меток адресов 8k..8k+7 без старшего бита при чётности k, равной p
+_LOW_LABELS = tuple(sum((_parity(m) ^ p ^ 1) << (m - 1) for m in range(1, 8)) for p in (0, 1))
+
+
+def buffer_size(count: int) -> int:
+    """Байт на столбцы дерева из count узлов"""
+    return 12 * count + (count + 7) // 8
+
+
+def _fill(buf, count: int, lo: int, hi: int):
+    """
+    Заполнить узлы с адресами lo..hi-1 канонического бора из count узлов.
+    lo кратно 8, чтобы процессы не делили байты меток.
+    """
+    view = memoryview(buf)
+    child0 = view[:4 * count].cast('i')
+    child1 = view[4 * count:8 * count].cast('i')
+    suffix = view[8 * count:12 * count].cast('i')
+    labels = view[12 * count:]
+    try:
+        depth = count.bit_length() - 1
+        for d in range(depth + 1):
+            start, stop = 2**d - 1, 2**(d + 1) - 1
+            a, b = max(lo, start), min(hi, stop)
+            if a >= b:
+                continue
+            if d < depth:
+                child0[a:b] = array('i', range(2 * a + 1, 2 * b + 1, 2))
+                child1[a:b] = array('i', range(2 * a + 2, 2 * b + 2, 2))
+            else:
+                child0[a:b] = child1[a:b] = array('i', [NIL]) * (b - a)
+            if d == 0:
+                suffix[a:b] = array('i', [NIL])
+                continue
+            # Номер i на уровне d без старшего бита: первая половина уровня — i, вторая — i - half
+            half, prev = 2**(d - 1), 2**(d - 1) - 1
+            i0, i1 = a - start, b - start
+            column = array('i', range(prev + i0, prev + min(i1, half)))
+            column.extend(range(prev + max(i0, half) - half, prev + i1 - half))
+            suffix[a:b] = column
+
+        # Метка узла a — чётность его номера на уровне, то есть чётность (a + 1) без старшего бита
+        for k in range(lo >> 3, (hi + 7) >> 3):
+            byte = _LOW_LABELS[_parity(k)] | ((_parity(k + 1) ^ 1) << 7)
+            if 8 * k + 8 > count:
+                byte &= (1 << (count - 8 * k)) - 1
+            labels[k] = byte
+    finally:
+        for part in (child0, child1, suffix, labels, view):
+            part.release()
+
+
+def _fill_shared(name: str, count: int, lo: int, hi: int):
+    """Задача процесса пула: подключиться к блоку по имени и заполнить диапазон"""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        _fill(block.buf, count, lo, hi)
+    finally:
+        block.close()
+
+
+def _ranges(count: int, tasks: int) -> List[Tuple[int, int]]:
+    step = max(8, (-(-count // tasks) + 7) & ~7)
+    return [(lo, min(count, lo + step)) for lo in range(0, count, step)]
+
+
+def _to_memory(buf, count: int) -> ArrayAddressSpace:
+    """Скопировать столбцы в собственные массивы пространства"""
+    view = memoryview(buf)
+    columns = []
+    for offset in (0, 4 * count, 8 * count):
+        column = array('i')
+        column.frombytes(view[offset:offset + 4 * count])
+        columns.append(column)
+    labels = bytearray(view[12 * count:])
+    view.release()
+    return ArrayAddressSpace.from_columns(*columns, labels, count)
+
+
+def available_cpus() -> int:
+    """Ядра, на которых процессу разрешено работать (не больше os.cpu_count())"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+_seconds_per_node: Optional[float] = None
+
+
+def seconds_per_node() -> float:
+    """Замеренная стоимость заполнения одного узла в своём процессе (замер один на процесс)"""
+    global _seconds_per_node
+    if _seconds_per_node is None:
+        buf = bytearray(buffer_size(_CALIBRATION_NODES))
+        start = time.perf_counter()
+        _fill(buf, _CALIBRATION_NODES, 0, _CALIBRATION_NODES)
+        _seconds_per_node = (time.perf_counter() - start) / _CALIBRATION_NODES
+    return _seconds_per_node
+
+
+def pool_pays_off(count: int, workers: int) -> bool:
+    """Быстрее ли заполнить count узлов на пуле из workers процессов, чем в своём процессе"""
+    cores = min(workers, available_cpus())
+    if cores <= 1:
+        return False
+    serial = count * seconds_per_node()
+    return serial - serial / cores > POOL_DISPATCH_SECONDS
+
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """Общий пул из workers процессов: запускается при первом обращении и живёт до выхода"""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            if not _pools:
+                # Финализатор multiprocessing, а не atexit: дочерние процессы (например,
+                # процессы пула difftest) atexit не выполняют и без него вечно ждали бы
+                # процессы своего пула. Регистрируется в том процессе, что создаёт пул:
+                # унаследованные при fork финализаторы сбрасываются
+                multiprocessing.util.Finalize(None, shutdown_pools, exitpriority=100)
+            pool = _pools[workers] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context(_START_METHOD))
+        return pool
+
+
+def warm_pool(workers: int) -> ProcessPoolExecutor:
+    """Запустить все процессы общего пула заранее, чтобы первое построение не платило за запуск"""
+    pool = get_pool(workers)
+    for task in [pool.submit(time.sleep, 0.05) for _ in range(workers)]:
+        task.result()
+    return pool
+
+
+def shutdown_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(cancel_futures=True)
+        _pools.clear()
+
+
+
+def construct_parallel(depth: int, workers: Optional[int] = None,
+                       min_nodes: Optional[int] = None) -> Tuple[ArrayAddressSpace, int, List[range]]:
+    """
+    Построить полный бор чётности глубины depth со ссылками 'S' в новой памяти.
+    workers — число процессов (по умолчанию os.cpu_count()). Пул берётся, если
+    pool_pays_off; min_nodes — вместо этой оценки брать пул с такого размера
+    дерева при любом числе ядер (0 — всегда, например для проверки пути пула).
+    Возвращает (память, корень, уровни) в каноническом размещении.
+    """
+    count = 2 ** (depth + 1) - 1
+    levels = [range(2**d - 1, 2**(d + 1) - 1) for d in range(depth + 1)]
+    workers = workers or os.cpu_count() or 1
+    use_pool = pool_pays_off(count, workers) if min_nodes is None else count >= min_nodes
+    if workers <= 1 or not use_pool:
+        buf = bytearray(buffer_size(count))
+        _fill(buf, count, 0, count)
+        return _to_memory(buf, count), 0, levels
+
+    pool = get_pool(workers)
+    block = shared_memory.SharedMemory(create=True, size=buffer_size(count))
+    try:
+        tasks = [pool.submit(_fill_shared, block.name, count, lo, hi)
+                 for lo, hi in _ranges(count, workers * TASKS_PER_WORKER)]
+        for task in tasks:
+            task.result()
+        memory = _to_memory(block.buf, count)
+    finally:
+        block.close()
+        block.unlink()
+    return memory, 0, levels
+
+
+def can_build_parallel(machine, depth: int) -> bool:
+    """
+    Можно ли поставить в машину бор глубины depth из новой памяти без потерь:
+    память столбцовая, без отладочного содержимого, и деревьев в ней нет
+    либо единственное каноническое дерево режима in_place растёт вглубь
+    """
+    if not isinstance(machine.memory, ArrayAddressSpace) or machine.debug_payload:
+        return False
+    if not (machine.trees or machine.windows):
+        return True
+    return (machine.expansion == 'in_place' and machine.is_canonical()
+            and len(machine.target_levels) - 1 < depth)
@@ -0,0 +1,120 @@
+"""
+Вывод живых демонстраций МТ и KUM без потери скорости.
+
+Печать ленты целиком стоит O(прочитанных бит) на каждый бит, а сам
+терминал медленнее машин на порядки. Поэтому:
+  * format_tape показывает только активное окно и небольшой запас вокруг;
+  * Renderer рисует не чаще refresh_hz кадров в секунду — промежуточные
+    кадры пропускаются, и их текст даже не форматируется;
+  * в режиме 'summary' вместо кадров раз в период печатается сводная строка.
+"""
+import sys
+import time
+from typing import Any, Callable, Optional, TextIO, Tuple
+
+from bitwindow import BitWindow
+
+MODES = ('full', 'summary', 'off')
+DEFAULT_MARGIN = 4
+
+
+def format_tape(tape: BitWindow, window_size: int, margin: int = DEFAULT_MARGIN,
+                highlight_window: bool = True, leaving_bit_pos: Optional[int] = None) -> Tuple[str, int]:
+    """
+    Окно из window_size последних бит и margin бит перед ним.
+    Возвращает (строка, абсолютный номер первой показанной ячейки);
+    каждая ячейка занимает 3 символа, многоточие отмечает скрытое начало.
+    """
+    first = max(tape.first, tape.total - window_size - margin)
+    start = tape.total - window_size
+    highlight = highlight_window and tape.total >= window_size
+    parts = ["…" if first > 0 else ""]
+    for pos in range(first, tape.total):
+        bit = tape.bit_at(pos)
+        if highlight and pos >= start:
+            parts.append(f"[{bit}]")
+        elif pos == leaving_bit_pos:
+            parts.append(f"({bit})")
+        else:
+            parts.append(f" {bit} ")
+    return "".join(parts), first
+
+
+class Renderer:
+    """
+    Прореживание вывода до refresh_hz кадров в секунду (0 — без ограничения).
+
+    frame(build) принимает функцию, возвращающую текст кадра: она вызывается
+    только для кадров, которые действительно печатаются, и только для
+    последнего из накопившихся. Поэтому после пачки бит нужен flush().
+    status — поля для сводной строки режима 'summary'.
+    """
+
+    def __init__(self, mode: str = 'full', refresh_hz: float = 20.0, stream: Optional[TextIO] = None,
+                 margin: int = DEFAULT_MARGIN, clock: Callable[[], float] = time.monotonic):
+        if mode not in MODES:
+            raise ValueError(f"Unknown render mode: {mode}")
+        self.mode = mode
+        self.interval = 1.0 / refresh_hz if refresh_hz > 0 else 0.0
+        self.stream = stream
+        self.margin = margin
+        self.clock = clock
+        self.frames = 0
+        self.skipped = 0
+        self.status = {}
+        self._pending: Optional[Callable[[], str]] = None
+        self._last_draw: Optional[float] = None
+        self._started = clock()
+
+    def _due(self) -> bool:
+        now = self.clock()
+        if self._last_draw is None or now - self._last_draw >= self.interval:
+            self._last_draw = now
+            return True
+        return False
+
+    def _write(self, text: str):
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write(text + "\n")
+
+    def frame(self, build: Callable[[], str], **status: Any):
+        self.frames += 1
+        self.status.update(status)
+        if self.mode == 'off':
+            return
+        if self.mode == 'summary':
+            if self._due():
+                self._write(self.summary())
+            return
+        if self._due():
+            self._draw(build)
+        else:
+            if self._pending is not None:
+                self.skipped += 1
+            self._pending = build
+
+    def _draw(self, build: Callable[[], str]):
+        if self.skipped:
+            self._write(f"\033[90m… пропущено кадров: {self.skipped}\033[0m")
+            self.skipped = 0
+        self._pending = None
+        self._write(build())
+
+    def message(self, text: str):
+        """Вне кадров: напечатать сразу, предварительно дорисовав отложенный кадр"""
+        if self.mode != 'off':
+            self.flush()
+            self._write(text)
+
+    def flush(self):
+        """Дорисовать последний отложенный кадр (или сводку)"""
+        if self.mode == 'full' and self._pending is not None:
+            self._last_draw = self.clock()
+            self._draw(self._pending)
+        elif self.mode == 'summary' and self.frames:
+            self._write(self.summary())
+
+    def summary(self) -> str:
+        elapsed = max(1e-9, self.clock() - self._started)
+        fields = " | ".join(f"{key}: {value}" for key, value in self.status.items())
+        return f"[кадров: {self.frames}, {self.frames / elapsed:.0f}/с] {fields}"
@@ -0,0 +1,398 @@
+import math
+import os
+import threading
+import time
+from collections import Counter
+from typing import Optional, Dict, Any, List, Tuple
+from KUM import KolmogorovUspenskyMachine
+from gamma_cache import GammaCache, can_replace_memory
+from instrumentation import EXPANSION_DECISION
+from parallel_build import can_build_parallel
+
+# Оценки до первых замеров: байт на узел (ArrayAddressSpace ~13, объектная память ~760) и секунд на узел
+DEFAULT_BYTES_PER_NODE = {'ArrayAddressSpace': 13.0, 'GraphAddressSpace': 800.0}
+DEFAULT_SECONDS_PER_NODE = 2e-6
+# Сколько узлов построения допускается на один входной бит в среднем за всё время работы
+DEFAULT_MAX_AMORTIZED_COST = 8.0
+# Доля прогресса фонового построения, отведённая записи готового дерева в кэш
+STORE_SHARE = 0.1
+
+
+def memory_bytes(memory) -> float:
+    """Объём памяти машины: точный для столбцовой, оценка для объектной"""
+    if hasattr(memory, 'nbytes'):
+        return memory.nbytes()
+    return len(memory) * DEFAULT_BYTES_PER_NODE.get(type(memory).__name__, 800.0)
+
+
+class ExpansionPlanner:
+    """
+    Когда и можно ли переходить на Γ(L+1).
+
+    predict(L) оценивает число новых узлов, байты и время построения по
+    замерам прошлых построений (record_build). admit(L) не пускает
+    построение, которое не помещается в memory_budget байт. decide(bits)
+    откладывает расширение, пока средняя стоимость предобработки (построенных
+    узлов на прочитанный бит, вместе со следующим уровнем) выше
+    max_amortized_cost, и не раньше, чем текущее окно заполнится.
+
+    Каждое решение — словарь с action ('expand', 'wait', 'refuse'), reason и
+    прогнозом. Решения считаются в counts, смены решения попадают в decisions
+    и в трассировщик машины событием expansion-decision.
+    """
+
+    def __init__(self, machine: KolmogorovUspenskyMachine, memory_budget: Optional[int] = None,
+                 max_amortized_cost: float = DEFAULT_MAX_AMORTIZED_COST, max_L: Optional[int] = None,
+                 cache: Optional[GammaCache] = None, workers: Optional[int] = None):
+        self.machine = machine
+        self.memory_budget = memory_budget
+        self.max_amortized_cost = max_amortized_cost
+        self.max_L = max_L
+        self.cache = cache
+        self.workers = workers
+        # Замеры построений: L, source ('build', 'pool', 'cache'), nodes, seconds, bytes
+        self.history: List[Dict[str, Any]] = []
+        self.built_nodes = 0
+        self.counts: Counter = Counter()
+        self.decisions: List[Dict[str, Any]] = []
+        self.last: Optional[Dict[str, Any]] = None
+        self._checked: Optional[Tuple[tuple, Tuple[Optional[str], Dict[str, Any]]]] = None
+
+    def record_build(self, L: int, nodes: int, seconds: float, source: str = 'build'):
+        """Учесть готовое построение; загрузки из кэша в стоимость предобработки не входят"""
+        if source != 'cache':
+            self.built_nodes += nodes
+        self.history.append({'L': L, 'source': source, 'nodes': nodes, 'seconds': seconds,
+                             'bytes': memory_bytes(self.machine.memory)})
+
+    def _rate(self, cached: bool) -> float:
+        """Секунд на узел по замерам того же вида (построение или загрузка)"""
+        samples = [h for h in self.history if (h['source'] == 'cache') == cached and h['nodes']]
+        if not samples:
+            return 0.0 if cached else DEFAULT_SECONDS_PER_NODE
+        return sum(h['seconds'] for h in samples) / sum(h['nodes'] for h in samples)
+
+    def _bytes_per_node(self) -> float:
+        memory = self.machine.memory
+        if hasattr(memory, 'nbytes') and len(memory):
+            return memory.nbytes() / len(memory)
+        return DEFAULT_BYTES_PER_NODE.get(type(memory).__name__, 800.0)
+
+    def predict(self, L: int) -> Dict[str, Any]:
+        """
+        Прогноз для Γ(L): узлов в дереве и сколько из них строить, байты после
+        перехода и пик во время построения, время построения или загрузки
+        """
+        machine = self.machine
+        size = machine.tree_size(L)
+        per_node = self._bytes_per_node()
+        current_bytes = memory_bytes(machine.memory)
+        cached = (self.cache is not None and can_replace_memory(machine)
+                  and os.path.exists(self.cache.path(L)))
+        pool = not cached and self.workers is not None and can_build_parallel(machine, 2**L)
+        extend = (machine.expansion == 'in_place' and bool(machine.trees or machine.windows)
+                  and len(machine.target_levels) - 1 < 2**L)
+
+        if cached or pool:
+            # Новая память заменяет старую, но сначала существует рядом с ней (у пула — ещё и общий блок)
+            new_nodes = 0 if cached else size
+            total_bytes = size * per_node
+            peak_bytes = current_bytes + size * per_node * (2 if pool else 1)
+        elif extend:
+            # Фоновая достройка уже могла вырастить память — считаем от текущего дерева
+            new_nodes = size - (2 ** len(machine.target_levels) - 1)
+            total_bytes = peak_bytes = size * per_node
+        else:
+            new_nodes = size
+            total_bytes = peak_bytes = current_bytes + size * per_node
+        return {
+            'L': L,
+            'N': 2**L,
+            'nodes': size,
+            'new_nodes': new_nodes,
+            'bytes': int(total_bytes),
+            'peak_bytes': int(peak_bytes),
+            'seconds': (size if cached else new_nodes) * self._rate(cached),
+            'source': 'cache' if cached else 'pool' if pool else 'build',
+        }
+
+    def _record(self, decision: Dict[str, Any]) -> Dict[str, Any]:
+        self.counts[(decision['action'], decision['reason'])] += 1
+        key = (decision['action'], decision['reason'], decision.get('L'))
+        last = self.last
+        decision['changed'] = last is None or key != (last['action'], last['reason'], last.get('L'))
+        if decision['changed']:
+            self.decisions.append(decision)
+            inst = self.machine.instrumentation
+            if inst is not None:
+                inst.emit(EXPANSION_DECISION, **decision)
+        self.last = decision
+        return decision
+
+    def _check(self, L: int) -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        Причина отказа (или None) и прогноз. Прогноз меняется только вместе
+        с памятью машины или историей замеров, поэтому между ними он кэшируется:
+        decide вызывается на каждом бите.
+        """
+        if self.max_L is not None and L > self.max_L:
+            return 'max-level', {'L': L}
+        memory = self.machine.memory
+        key = (L, id(memory), len(memory), len(self.history))
+        if self._checked is not None and self._checked[0] == key:
+            return self._checked[1]
+        prediction = self.predict(L)
+        reason = None
+        if self.memory_budget is not None and prediction['peak_bytes'] > self.memory_budget:
+            reason = 'over-budget'
+        self._checked = key, (reason, prediction)
+        return reason, prediction
+
+    def admit(self, L: int) -> bool:
+        """Можно ли начинать построение Γ(L) (бюджет памяти и max_L)"""
+        reason, prediction = self._check(L)
+        action = 'refuse' if reason else 'build'
+        self._record(dict(prediction, action=action, reason=reason or 'fits-budget',
+                          budget=self.memory_budget))
+        return reason is None
+
+    def decide(self, bits_since_build: int) -> Dict[str, Any]:
+        """Решение о переходе на следующий уровень после bits_since_build бит на текущем"""
+        machine = self.machine
+        N = machine.target_N
+        L = machine.current_L + 1
+        reason, prediction = self._check(L)
+        decision = dict(prediction, budget=self.memory_budget, bits_since_build=bits_since_build)
+        if reason is not None:
+            return self._record(dict(decision, action='refuse', reason=reason))
+
+        total_bits = machine.input_buffer.total
+        spent = self.built_nodes + prediction['new_nodes']
+        cost = spent / max(1, total_bits)
+        # Сколько ещё бит прочитать, чтобы средняя стоимость опустилась до порога
+        bits_needed = math.ceil(spent / self.max_amortized_cost) - total_bits if self.max_amortized_cost > 0 else None
+        decision.update(amortized_cost=cost, target_cost=self.max_amortized_cost,
+                        bits_needed=max(0, bits_needed) if bits_needed is not None else None)
+        if bits_since_build < N:
+            return self._record(dict(decision, action='wait', reason='window-filling'))
+        if cost > self.max_amortized_cost:
+            return self._record(dict(decision, action='wait', reason='amortizing'))
+        return self._record(dict(decision, action='expand', reason='amortized'))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            'built_nodes': self.built_nodes,
+            'bits': self.machine.input_buffer.total,
+            'memory_bytes': int(memory_bytes(self.machine.memory)),
+            'memory_budget': self.memory_budget,
+            'counts': {f"{action}/{reason}": n for (action, reason), n in self.counts.items()},
+            'last': self.last,
+            'decisions': list(self.decisions),
+            'history': list(self.history),
+        }
+
+
+class BackgroundBuilder:
+    """
+    Предпостроение Γ(L+1) в фоновом потоке, пока Γ(L) обслуживает поток битов.
+
+    Узлы нового уровня строятся через construct_tree, которое не трогает
+    курсор и буфер машины. Подмена дерева (install_tree) выполняется только
+    в основном потоке, между двумя битами, поэтому для обработки она атомарна.
+    С machine.seamless=True курсор переносится на новый уровень без пика O(N).
+    С cache уровень сначала ищется на диске, а построенный сохраняется туда.
+    С workers дерево строится на пуле процессов в новой памяти (parallel_build.py),
+    если её можно подменить; иначе — обычным построением в памяти машины.
+    С planner построение начинается, только если planner.admit его пускает,
+    а время каждого готового построения записывается в planner.
+    """
+
+    def __init__(self, machine: KolmogorovUspenskyMachine, max_L: Optional[int] = None,
+                 auto_swap: bool = False, cache: Optional[GammaCache] = None,
+                 workers: Optional[int] = None, planner: Optional[ExpansionPlanner] = None):
+        self.machine = machine
+        self.max_L = max_L
+        self.cache = cache
+        self.workers = workers
+        self.planner = planner
+        # auto_swap: ставить новое дерево сразу по готовности, не дожидаясь request_swap
+        self.auto_swap = auto_swap
+        self.target_L: Optional[int] = None
+        self.swap_requested = False
+
+        self._thread: Optional[threading.Thread] = None
+        # (корень, уровни, память или None, если дерево строилось в памяти машины)
+        self._result: Optional[Tuple[int, list, Any]] = None
+        self._error: Optional[BaseException] = None
+        # Откуда взялось дерево: 'cache', 'pool' или 'build'
+        self._source = 'build'
+        self._started_at = 0.0
+        self._finished_at: Optional[float] = None
+        self._base_nodes = 0
+        self._total_nodes = 0
+        # После построения дерево ещё пишется в кэш: до конца записи оно не готово
+        self._store_pending = False
+
+    def _expected_nodes(self, L: int) -> int:
+        machine = self.machine
+        size = machine.tree_size(L)
+        if machine.expansion == 'in_place' and machine.trees and max(machine.trees) < L:
+            size -= machine.tree_size(max(machine.trees))
+        return size
+
+    def start(self, L: Optional[int] = None) -> bool:
+        """Начать фоновое построение Γ(L) (по умолчанию следующего уровня)"""
+        if self.running or self._result is not None:
+            return False
+        L = self.machine.current_L + 1 if L is None else L
+        if self.max_L is not None and L > self.max_L:
+            return False
+        if self.planner is not None and not self.planner.admit(L):
+            return False
+
+        self.target_L = L
+        self.swap_requested = False
+        self._error = None
+        self._finished_at = None
+        self._base_nodes = len(self.machine.memory)
+        self._total_nodes = self._expected_nodes(L)
+        self._started_at = time.perf_counter()
+        use_cache = self.cache is not None and can_replace_memory(self.machine)
+        use_pool = self.workers is not None and can_build_parallel(self.machine, 2**L)
+        self._store_pending = self.cache is not None and not use_pool
+        self._thread = threading.Thread(target=self._run, args=(L, use_cache, use_pool), daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self, L: int, use_cache: bool, use_pool: bool):
+        try:
+            loaded = self.cache.load(L) if use_cache else None
+            if loaded is not None:
+                self._source = 'cache'
+                self._result = loaded[1], loaded[2], loaded[0]
+                return
+            if use_pool:
+                self._source = 'pool'
+                memory, root, levels = self.machine.construct_parallel(2**L, self.workers, {'L': L})
+                self._result = root, levels, memory
+                return
+            self._source = 'build'
+            root, levels = self.machine.construct_tree(L)
+            if self.cache is not None:
+                try:
+                    self.cache.store(self.machine, L, levels)
+                except OSError:
+                    pass
+            self._result = root, levels, None
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._finished_at = time.perf_counter()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def ready(self) -> bool:
+        return self._result is not None
+
+    def progress(self) -> float:
+        """
+        Доля работы, 0..1: построенные узлы, а при записи в кэш — ещё и запись
+        (STORE_SHARE). 1.0 — только когда дерево можно ставить.
+        """
+        if self.target_L is None:
+            return 0.0
+        if self.ready:
+            return 1.0
+        built = len(self.machine.memory) - self._base_nodes
+        share = 1.0 - STORE_SHARE if self._store_pending else 1.0
+        return min(1.0, built / max(1, self._total_nodes)) * share
+
+    def eta(self) -> Optional[float]:
+        """Оценка оставшегося времени построения в секундах"""
+        if self.target_L is None:
+            return None
+        if self.ready:
+            return 0.0
+        done = self.progress()
+        if done <= 0:
+            return None
+        elapsed = time.perf_counter() - self._started_at
+        return elapsed * (1 - done) / done
+
+    def status(self) -> Dict[str, Any]:
+        end = self._finished_at if self._finished_at is not None else time.perf_counter()
+        return {
+            'target_L': self.target_L,
+            'running': self.running,
+            'ready': self.ready,
+            'progress': self.progress(),
+            'eta': self.eta(),
+            'elapsed': end - self._started_at if self.target_L is not None else 0.0,
+            'nodes_total': self._total_nodes,
+        }
+
+    def request_swap(self) -> bool:
+        """Попросить перейти на следующий уровень, как только он будет готов"""
+        if self.target_L is None and not self.start():
+            return False
+        self.swap_requested = True
+        return self.poll()
+
+    def poll(self, start_next: bool = True) -> bool:
+        """
+        Поставить готовое дерево, если его ждут. Возвращает True при подмене.
+        start_next — сразу начать строить следующий уровень.
+        """
+        if self._error is not None:
+            error, self._error = self._error, None
+            self.target_L = None
+            raise error
+        if not self.ready or not (self.swap_requested or self.auto_swap):
+            return False
+
+        root, levels, memory = self._result
+        L = self.target_L
+        self._result = None
+        self._thread = None
+        self.target_L = None
+        self.swap_requested = False
+        self.machine.install_tree(L, root, levels, memory=memory)
+        if self.planner is not None:
+            # Пул и кэш дают дерево целиком, обычная достройка — только новые узлы
+            nodes = self._total_nodes if self._source == 'build' else self.machine.tree_size(L)
+            self.planner.record_build(L, nodes, self._finished_at - self._started_at, self._source)
+        # Следующий уровень начинаем строить сразу, как только текущий пошёл в работу
+        if start_next:
+            self.start()
+        return True
+
+    def wait(self):
+        """Дождаться окончания фонового построения, ничего не подменяя"""
+        if self._thread is not None:
+            self._thread.join()
+
+    def finish(self, start_next: bool = True) -> bool:
+        """Дождаться построения и поставить дерево (блокирующий вариант)"""
+        self.wait()
+        self.swap_requested = True
+        return self.poll(start_next)
+
+    def discard(self):
+        """
+        Дождаться фонового построения и выбросить его результат, не ставя
+        дерево. После этого можно строить синхронно или начать другой уровень.
+        """
+        self.wait()
+        self._result = None
+        self._error = None
+        self._thread = None
+        self.target_L = None
+        self.swap_requested = False
+
+    def process_bit_step(self, bit: int):
+        """Шаг машины с проверкой готовности нового уровня перед ним"""
+        self.poll()
+        return self.machine.process_bit_step(bit)
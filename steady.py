@@ -0,0 +1,69 @@
+"""
+Автомат установившегося режима, сжатый из Γ(L).
+
+После начального окна курсор ходит только по листам: лист -> 'S' -> ребро
+бита -> лист. Внутренние узлы нужны лишь для первого спуска от корня.
+Сжатие оставляет 2^N состояний-листов с прямыми переходами по 0 и 1
+и метками: шаг — одно обращение по индексу, а память — 8 байт и бит
+на лист вместо трёх ссылок на каждый из 2^(N+1) узлов дерева.
+
+Лист с индексом j — окно, чьи N бит, прочитанные как двоичное число
+(старший — самый старый бит), равны j. Поэтому начальное окно находится
+прямой индексацией, без спуска по дереву.
+"""
+from array import array
+from typing import Iterable, List, Optional
+
+from memory import ArrayAddressSpace
+
+
+class SteadyAutomaton:
+    """Листья бора окна N с прямыми переходами next0/next1 и упакованными метками"""
+
+    def __init__(self, N: int, next0: array, next1: array, labels: bytearray):
+        self.N = N
+        self.next0 = next0
+        self.next1 = next1
+        self.next = (next0, next1)
+        self.labels = labels
+
+    @classmethod
+    def from_machine(cls, machine, levels: Optional[List[range]] = None) -> 'SteadyAutomaton':
+        """Снять переходы лист -> лист с дерева машины (по умолчанию — целевого)"""
+        levels = machine.target_levels if levels is None else levels
+        mem = machine.memory
+        leaves = levels[-1]
+        start = leaves.start
+        next0, next1 = array('i'), array('i')
+        labels = bytearray((len(leaves) + 7) // 8)
+        if isinstance(mem, ArrayAddressSpace):
+            suffix, (child0, child1) = mem.suffix, mem.children
+            for leaf in leaves:
+                s = suffix[leaf]
+                next0.append(child0[s] - start)
+                next1.append(child1[s] - start)
+        else:
+            for leaf in leaves:
+                s = mem.follow(leaf, 'S')
+                next0.append(mem.follow(s, '0') - start)
+                next1.append(mem.follow(s, '1') - start)
+        for index, leaf in enumerate(leaves):
+            if mem.get_label(leaf):
+                labels[index >> 3] |= 1 << (index & 7)
+        return cls(len(levels) - 1, next0, next1, labels)
+
+    def __len__(self) -> int:
+        return len(self.next0)
+
+    def label(self, state: int) -> int:
+        return (self.labels[state >> 3] >> (state & 7)) & 1
+
+    def state_for_window(self, bits: Iterable[int]) -> int:
+        """Состояние для окна из N бит (самый старый бит — первый)"""
+        state = 0
+        for bit in bits:
+            state = (state << 1) | bit
+        return state
+
+    def nbytes(self) -> int:
+        return 2 * self.next0.itemsize * len(self.next0) + len(self.labels)
@@ -0,0 +1,116 @@
+"""
+Много независимых потоков над одним общим Γ(L).
+
+Граф после построения только читается, поэтому всё состояние потока —
+это курсор: узел, глубина и счётчик операций. Окно входа курсору не нужно:
+пока окно заполняется, курсор спускается от корня по одному ребру на бит,
+а дальше узел глубины N сам задаёт последние N бит.
+"""
+from concurrent.futures import Executor
+from typing import Dict, Hashable, Iterable, Optional
+
+from bitwindow import BitWindow, as_bit_buffer
+from memory import ArrayAddressSpace, GraphAddressSpace
+
+
+class GammaGraph:
+    """Только читаемое представление построенного Γ(L), общее для курсоров"""
+
+    _EDGE = ('0', '1')
+
+    def __init__(self, memory: GraphAddressSpace, root: int, L: Optional[int], N: Optional[int] = None):
+        self.memory = memory
+        self.root = root
+        self.L = L
+        # N задаётся явно для точных окон (build_window), иначе N = 2^L
+        self.N = 2 ** L if N is None else N
+        self._columns = isinstance(memory, ArrayAddressSpace)
+
+    @classmethod
+    def from_machine(cls, machine, L: Optional[int] = None) -> 'GammaGraph':
+        """Γ(L) машины; без L — её целевое дерево, в том числе точное окно"""
+        if L is None:
+            if machine.exact_window is not None:
+                return cls(machine.memory, machine.target_root, None, machine.exact_window)
+            L = machine.current_L
+        return cls(machine.memory, machine.trees[L], L)
+
+    def child(self, node: int, bit: int) -> int:
+        if self._columns:
+            return self.memory.children[bit][node]
+        return self.memory.follow(node, self._EDGE[bit])
+
+    def suffix(self, node: int) -> int:
+        if self._columns:
+            return self.memory.suffix[node]
+        return self.memory.follow(node, 'S')
+
+    def label(self, node: int) -> int:
+        return self.memory.get_label(node)
+
+    def cursor(self, keep_window: bool = False) -> 'StreamCursor':
+        """Новый поток с начала; keep_window — хранить ещё и последние N бит"""
+        if keep_window:
+            return WindowedStreamCursor(self)
+        return StreamCursor(self)
+
+
+class StreamCursor:
+    """
+    Состояние одного потока над общим графом. Разные курсоры можно
+    продвигать из разных потоков пула одновременно: граф они только читают.
+    """
+    __slots__ = ('graph', 'node', 'depth', 'operations')
+
+    def __init__(self, graph: GammaGraph):
+        self.graph = graph
+        self.node = graph.root
+        self.depth = 0
+        self.operations = 0
+
+    def advance(self, bit: int) -> int:
+        """Один бит: 0, пока окно заполняется, затем XOR последних N бит"""
+        graph = self.graph
+        if self.depth < graph.N:
+            self.node = graph.child(self.node, bit)
+            self.depth += 1
+            self.operations += 1
+            if self.depth < graph.N:
+                return 0
+        else:
+            self.node = graph.child(graph.suffix(self.node), bit)
+            self.operations += 2
+        return graph.label(self.node)
+
+    def advance_bits(self, bits) -> bytearray:
+        data = as_bit_buffer(bits)
+        outputs = bytearray(len(data))
+        advance = self.advance
+        for i, bit in enumerate(data):
+            outputs[i] = advance(bit)
+        return outputs
+
+
+class WindowedStreamCursor(StreamCursor):
+    """Курсор, который дополнительно хранит окно из N последних бит"""
+    __slots__ = ('window',)
+
+    def __init__(self, graph: GammaGraph):
+        super().__init__(graph)
+        self.window = BitWindow(graph.N)
+
+    def advance(self, bit: int) -> int:
+        self.window.append(bit)
+        return super().advance(bit)
+
+
+def advance_streams(cursors: Dict[Hashable, StreamCursor], chunks: Dict[Hashable, Iterable[int]],
+                    executor: Optional[Executor] = None) -> Dict[Hashable, bytearray]:
+    """
+    Продвинуть несколько курсоров на свои порции бит.
+    С executor (например, ThreadPoolExecutor) каждый курсор идёт отдельной задачей.
+    """
+    if executor is None:
+        return {key: cursors[key].advance_bits(bits) for key, bits in chunks.items()}
+    futures = {key: executor.submit(cursors[key].advance_bits, bits) for key, bits in chunks.items()}
+    return {key: future.result() for key, future in futures.items()}
@@ -0,0 +1,127 @@
+"""
+Переходы Γ(L) сразу на k бит (k = 4 или 8).
+
+В установившемся режиме курсор всегда стоит в листе (узле глубины N),
+а шаг «S, затем ребро бита» ведёт из листа в лист. Таблица шагов
+на один бит снимается с построенного графа, после чего удваивается:
+T_2k[v][hi, lo] = T_k[T_k[v][hi]][lo]. В итоге на каждый лист и каждую
+k-битную порцию хранится лист после порции и k выходных меток.
+
+Вход и выход упакованы в байты старшим битом вперёд: первый бит порции —
+старший. Таблица занимает 2^N * 2^k записей, то есть для L = 4 и k = 8 —
+16M переходов: ещё одна плата препроцессингом за более быструю обработку.
+"""
+from array import array
+from typing import Tuple
+
+from memory import ArrayAddressSpace
+
+STRIDES = (4, 8)
+
+
+def bit_of(data, pos: int) -> int:
+    """Бит номер pos упакованного буфера (старший бит байта — первый)"""
+    return (data[pos >> 3] >> (7 - (pos & 7))) & 1
+
+
+def unpack_msb(data, start: int, stop: int) -> bytearray:
+    """Биты start..stop-1 упакованного буфера как байты-биты"""
+    return bytearray(bit_of(data, pos) for pos in range(start, stop))
+
+
+class StrideTable:
+    """
+    Таблица k-битных переходов между листами целевого дерева машины.
+    Листы нумеруются от начала их уровня: индекс = адрес - leaves.start.
+    Для машины, сжатой в автомат (steady.py), листы — его состояния.
+    """
+
+    def __init__(self, machine, k: int = 8):
+        if k not in STRIDES:
+            raise ValueError(f"Stride must be one of {STRIDES}, got {k}")
+        self.automaton = machine.automaton
+        self.memory = machine.memory
+        self.k = k
+        if self.automaton is not None:
+            self.leaves = range(len(self.automaton))
+        else:
+            self.leaves = machine.target_levels[-1]
+        self.next, self.out = self._one_bit_table(machine)
+        stride = 1
+        while stride < k:
+            self.next, self.out = self._double(stride)
+            stride *= 2
+
+    def _one_bit_table(self, machine) -> Tuple[array, bytearray]:
+        """Шаг на один бит для каждого листа — ровно те переходы, что делает машина"""
+        mem = self.memory
+        start = self.leaves.start
+        nxt, out = array('i'), bytearray()
+        if self.automaton is not None:
+            automaton = self.automaton
+            for state in self.leaves:
+                for bit in (0, 1):
+                    target = automaton.next[bit][state]
+                    nxt.append(target)
+                    out.append(automaton.label(target))
+            return nxt, out
+        if isinstance(mem, ArrayAddressSpace):
+            suffix, children = mem.suffix, mem.children
+            follow = lambda node, bit: children[bit][suffix[node]]
+        else:
+            edge = machine._EDGE
+            follow = lambda node, bit: mem.follow(mem.follow(node, 'S'), edge[bit])
+        for leaf in self.leaves:
+            for bit in (0, 1):
+                target = follow(leaf, bit)
+                nxt.append(target - start)
+                out.append(mem.get_label(target))
+        return nxt, out
+
+    def _double(self, stride: int) -> Tuple[array, bytearray]:
+        """Таблица на 2*stride бит из таблицы на stride бит"""
+        width = 1 << stride
+        nxt, out = self.next, self.out
+        new_next, new_out = array('i'), bytearray()
+        for base in range(0, len(nxt), width):
+            for hi in range(width):
+                mid = nxt[base + hi] * width
+                high = out[base + hi] << stride
+                new_next.extend(nxt[mid:mid + width])
+                new_out.extend(high | low for low in out[mid:mid + width])
+        return new_next, new_out
+
+    def covers(self, machine) -> bool:
+        """Подходит ли таблица к текущему дереву и курсору машины"""
+        node = machine.current_path_node
+        if machine.memory is not self.memory or machine.automaton is not self.automaton:
+            return False
+        if self.automaton is None and machine.target_levels[-1] != self.leaves:
+            return False
+        return node is not None and node in self.leaves
+
+    def run(self, node: int, data, outputs: bytearray, start: int, stop: int) -> int:
+        """
+        Пройти байты data[start:stop] из листа node, записывая упакованные
+        выходы в outputs. Возвращает адрес листа после последнего байта.
+        """
+        leaf = node - self.leaves.start
+        nxt, out = self.next, self.out
+        if self.k == 8:
+            for j in range(start, stop):
+                idx = (leaf << 8) | data[j]
+                outputs[j] = out[idx]
+                leaf = nxt[idx]
+        else:
+            for j in range(start, stop):
+                byte = data[j]
+                idx = (leaf << 4) | (byte >> 4)
+                high = out[idx]
+                leaf = nxt[idx]
+                idx = (leaf << 4) | (byte & 15)
+                outputs[j] = (high << 4) | out[idx]
+                leaf = nxt[idx]
+        return leaf + self.leaves.start
+
+    def nbytes(self) -> int:
+        return self.next.itemsize * len(self.next) + len(self.out)
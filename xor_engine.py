@@ -0,0 +1,163 @@
+"""
+Векторный скользящий XOR: эталон для МТ и KUM на больших N.
+
+XOR окна из N последних бит равен P[i] ^ P[i-N], где P — префиксный XOR
+потока. Поток упаковывается в одно длинное целое (бит i — i-й бит входа),
+префиксный XOR считается log2(n) сдвигами целого, а сдвиг на N даёт
+все окна сразу. Вся работа идёт машинными словами внутри int,
+без цикла Python по битам. Если установлен NumPy и вход — массив NumPy,
+используется np.bitwise_xor.accumulate.
+"""
+from typing import Dict, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from bitwindow import BitWindow, as_bit_buffer
+
+_TO_ASCII = bytes.maketrans(b'\x00\x01', b'01')
+_FROM_ASCII = bytes.maketrans(b'01', b'\x00\x01')
+
+
+def pack_bits(data) -> int:
+    """Байты-биты -> целое, где бит i равен data[i]"""
+    if not len(data):
+        return 0
+    return int(bytes(data).translate(_TO_ASCII)[::-1], 2)
+
+
+def unpack_bits(value: int, n: int) -> bytearray:
+    """Целое -> n байт-бит (обратно к pack_bits)"""
+    if n == 0:
+        return bytearray()
+    return bytearray(format(value, 'b').zfill(n)[::-1].encode('ascii').translate(_FROM_ASCII))
+
+
+def prefix_xor(value: int, n: int) -> int:
+    """Префиксный XOR n бит, упакованных в целое: бит i = XOR битов 0..i"""
+    shift = 1
+    while shift < n:
+        value ^= value << shift
+        shift <<= 1
+    return value & ((1 << n) - 1)
+
+
+def window_xor(prefix: int, n: int, N: int) -> int:
+    """
+    XOR окон длины N по префиксу: бит i = P[i] ^ P[i-N].
+    Биты i < N-1 (окно ещё не заполнено) обнуляются, как у МТ.
+    """
+    mask = (1 << n) - 1
+    out = (prefix ^ (prefix << N)) & mask
+    return out & ~((1 << (N - 1)) - 1)
+
+
+def sliding_xor(bits, N: int) -> bytearray:
+    """Выходы скользящего XOR окна N для всего потока за один проход"""
+    if np is not None and isinstance(bits, np.ndarray):
+        return _sliding_xor_numpy(bits, N)
+    data = as_bit_buffer(bits)
+    n = len(data)
+    return unpack_bits(window_xor(prefix_xor(pack_bits(data), n), n, N), n)
+
+
+def _sliding_xor_numpy(bits, N: int) -> bytearray:
+    prefix = np.bitwise_xor.accumulate(bits.astype(np.uint8))
+    out = np.zeros_like(prefix)
+    if len(prefix) >= N:
+        out[N - 1] = prefix[N - 1]
+        out[N:] = prefix[N:] ^ prefix[:-N]
+    return bytearray(out.tobytes())
+
+
+class PrefixXorEngine:
+    """
+    Потоковый векторный эталон с интерфейсом, как у RealTimeTuringMachine.
+    Между вызовами process_bits хранит только N последних бит.
+    """
+
+    def __init__(self, L: Optional[int] = None):
+        self.L = 0
+        self.window_size = 1
+        self.bit_index = 0
+        self._tail = bytearray()
+        if L is not None:
+            self.set_L(L)
+
+    def set_L(self, L: int):
+        self.L = L
+        self.window_size = 2 ** L
+        self.bit_index = 0
+        self._tail = bytearray()
+
+    def process_bits(self, bits) -> bytearray:
+        """Выходы для очередной порции бит (с нулями, пока окно не заполнено)"""
+        chunk = as_bit_buffer(bits)
+        combined = self._tail + chunk
+        out = sliding_xor(combined, self.window_size)
+        self.bit_index += len(chunk)
+        self._tail = combined[-self.window_size:]
+        return out[len(out) - len(chunk):]
+
+    def process_bit(self, bit: int) -> int:
+        return self.process_bits(bytes((bit,)))[0]
+
+
+class MultiWindowXorEngine:
+    """
+    Скользящий XOR сразу для нескольких окон N = 2^L за один проход.
+
+    Префиксный XOR потока общий для всех окон: каждое окно — это лишь
+    P ^ (P << N) над тем же префиксом. История тоже общая: одно окно
+    из max(N) последних бит и кольцо префиксных чётностей P_{t-maxN}..P_t,
+    по которому поштучный режим отвечает для всех окон за O(1) каждое.
+    """
+
+    def __init__(self, levels):
+        self.levels = sorted(set(levels))
+        if not self.levels:
+            raise ValueError("At least one level is required")
+        self.window_sizes = {L: 2 ** L for L in self.levels}
+        self.max_window = max(self.window_sizes.values())
+        self.bit_index = 0
+        self._history = BitWindow(self.max_window)
+        self._prefix = 0
+        self._prefixes = BitWindow(self.max_window + 1)
+        self._prefixes.append(0)
+
+    def process_bits(self, bits) -> Dict[int, bytearray]:
+        """Выходы для порции бит: {L: байт-биты выходов окна 2^L}"""
+        chunk = as_bit_buffer(bits)
+        m = len(chunk)
+        tail = bytes(self._history[-self.max_window:])
+        n = len(tail) + m
+        # Префикс от начала хвоста; абсолютный отличается на константу base
+        prefix = prefix_xor(pack_bits(tail + chunk), n)
+
+        outputs = {}
+        for L, N in self.window_sizes.items():
+            # Хвост короче N только в начале потока, и тогда он и есть весь поток
+            outputs[L] = unpack_bits(window_xor(prefix, n, N) >> len(tail), m)
+
+        base = self._prefixes.bit_at(self.bit_index - len(tail))
+        # В кольцо попадают только последние max(N)+1 префиксов, остальные — заглушки
+        start = max(len(tail), n - self._prefixes.capacity)
+        kept = bytes(base ^ ((prefix >> i) & 1) for i in range(start, n))
+        self._prefixes.extend(bytes(start - len(tail)) + kept)
+        if m:
+            self._prefix = base ^ ((prefix >> (n - 1)) & 1)
+        self._history.extend(chunk)
+        self.bit_index += m
+        return outputs
+
+    def process_bit(self, bit: int) -> Dict[int, int]:
+        """Один бит: XOR каждого окна — текущий префикс XOR префикс N шагов назад"""
+        self._prefix ^= bit
+        self._prefixes.append(self._prefix)
+        self._history.append(bit)
+        self.bit_index += 1
+        t = self.bit_index
+        return {L: self._prefix ^ self._prefixes.bit_at(t - N) if t >= N else 0
+                for L, N in self.window_sizes.items()}